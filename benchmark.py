@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+# -*- encoding: utf-8 -*-
+
+import os
+import sys
+import time
+import ujson
+import random
+import asyncio
+import logging
+import argparse
+import platform
+import tempfile
+import tracemalloc
+
+from aiogram import Bot, types
+from datetime import datetime, timedelta
+from vigil import (
+    VigilBot, VigilChatMember, VigilClock, VigilGroup, VigilMode, VigilOutbox, VigilResolver, VigilUser, VigilWinner,
+    numpy
+)
+from simulate import VigilFakeBot, VigilVirtualClock, TIMEZONES
+
+START: datetime = datetime(2026, 1, 1, 16, 30)  # Matches are running in most of TIMEZONES
+
+
+class VigilUnslotted(object):  # Same attributes in a per-instance __dict__, the layout before the slotted models
+    def __init__(self, values: dict):
+        for key, value in values.items():
+            setattr(self, key, value)
+
+
+def measure(function, repeat: int = 5) -> float:  # Best of several runs, in seconds
+    best: float = float('inf')
+    for _ in range(repeat):
+        started: float = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def make_group(group_id: int, users: int, timezones: int, rng: random.Random, mode: int = VigilMode.LAST) -> VigilGroup:
+    group: VigilGroup = VigilGroup(group_id, enabled=True, mode=VigilMode(mode))
+    for i in range(users):
+        user: VigilUser = VigilUser(
+            group_id * -100000 + i, START - timedelta(minutes=rng.uniform(0, 120)),
+            timezone=TIMEZONES[i % timezones]
+        )
+        group.hall[user.id] = user
+    return group
+
+
+def make_bot(storage: str, data_path: str) -> tuple:
+    bot: VigilFakeBot = VigilFakeBot('1:benchmark', [1])
+    Bot.set_current(bot)
+    vigil: VigilBot = VigilBot('1:benchmark', [1], data_path=data_path, storage=storage, bot=bot)
+    vigil.outbox = VigilOutbox(bot, global_rate=1e9, chat_rate=1e9, chat_capacity=int(1e9))
+    return vigil, bot
+
+
+def benchmark_grouping(rng: random.Random) -> list:
+    results: list = list()
+    for users in (10, 100, 1000):
+        for timezones in (1, 5, len(TIMEZONES)):
+            group: VigilGroup = make_group(-1, users, timezones, rng)
+
+            def rebuild():  # As after every change of hall
+                group.offset_index = None
+                group.i_dont_know_how_to_name_this_method(START)
+
+            seconds: float = measure(rebuild, repeat=20)
+            cached_seconds: float = measure(lambda: group.i_dont_know_how_to_name_this_method(START), repeat=20)
+            results.append({
+                'users': users, 'timezones': timezones, 'seconds': seconds, 'cached_seconds': cached_seconds
+            })
+    return results
+
+
+def benchmark_tick(rng: random.Random) -> list:
+    results: list = list()
+    for groups in (10, 100):
+        for users in (10, 100):
+            for timezones in (1, len(TIMEZONES)):
+                template: list = [make_group(-i - 1, users, timezones, rng) for i in range(groups)]
+                decision_time: datetime = START.replace(minute=0)
+                states: list = list()
+
+                def find_winners(resolver: VigilResolver):  # On fresh copies every time, a winner empties the hall
+                    for group in template:
+                        group.reset_index()
+                    states.clear()
+                    for group in template:
+                        copy: VigilGroup = VigilGroup(group.id, enabled=True, mode=group.mode)
+                        copy.hall = dict(group.hall)
+                        states.append(copy)
+                    started: float = time.perf_counter()
+                    resolver.resolve(states, decision_time)
+                    return time.perf_counter() - started
+
+                seconds: float = min(find_winners(VigilResolver()) for _ in range(3))
+                batch_seconds: float = min(find_winners(VigilResolver(vectorized=True)) for _ in range(3))
+                results.append({
+                    'groups': groups, 'users': users, 'timezones': timezones,
+                    'find_winner_seconds': seconds,
+                    'batch_find_winner_seconds': batch_seconds,
+                    'next_decision_seconds': measure(
+                        lambda: [group.next_decision_time(decision_time) for group in template], repeat=3
+                    )
+                })
+    return results
+
+
+def benchmark_auto_join(rng: random.Random) -> list:
+    results: list = list()
+    for users in (10, 100, 1000):
+        for timezones in (1, len(TIMEZONES)):
+            group: VigilGroup = make_group(-1, 0, 1, rng)
+            for i in range(users):
+                group.auto_join[i] = VigilUser(i, START, timezone=TIMEZONES[i % timezones])
+            join_time: datetime = VigilGroup.next_local_time(TIMEZONES[0], *group.get_auto_join_time(), START)
+
+            def enroll():  # Into an empty hall every time
+                group.hall.clear()
+                group.reset_index()
+                started: float = time.perf_counter()
+                group.apply_auto_join(join_time)
+                return time.perf_counter() - started
+
+            results.append({
+                'users': users, 'timezones': timezones,
+                'seconds': min(enroll() for _ in range(5)),
+                'enrolled': len(group.hall)
+            })
+    return results
+
+
+async def benchmark_broadcast(rng: random.Random, data_path: str) -> list:
+    results: list = list()
+    for groups in (10, 100):
+        vigil, bot = make_bot('journal', os.path.join(data_path, 'broadcast-%s.yaml' % groups))
+        day: str = START.strftime('%Y/%m/%d')
+        for i in range(groups):
+            group: VigilGroup = make_group(-i - 1, 10, len(TIMEZONES), rng)
+            vigil.data['groups'][group.id] = group
+            for j, timezone in enumerate(TIMEZONES):
+                group.winners.setdefault(day, dict())['+%04d' % j] = VigilWinner(
+                    VigilUser(j, START), [timezone]
+                )
+        started: float = time.perf_counter()
+        await vigil.broadcast_winner()
+        while not vigil.outbox.queue.empty():
+            await asyncio.sleep(0)
+        await asyncio.sleep(0.01)  # Last deliveries
+        vigil.outbox.task.cancel()
+        results.append({
+            'groups': groups, 'winners': groups * len(TIMEZONES),
+            'seconds': time.perf_counter() - started, 'messages_sent': len(bot.sent)
+        })
+        vigil.persistence.shutdown(wait=True)
+    return results
+
+
+async def benchmark_ingest(rng: random.Random, data_path: str) -> list:
+    results: list = list()
+    for participants in (0.05, 0.5):
+        vigil, bot = make_bot('journal', os.path.join(data_path, 'ingest-%s.yaml' % participants))
+        for i in range(100):
+            group: VigilGroup = make_group(-i - 1, 50, len(TIMEZONES), rng)
+            group.observer = vigil.handle_group_event
+            vigil.data['groups'][group.id] = group
+        vigil.index_participants()
+        messages: list = list()
+        for n in range(20000):
+            group_id: int = -rng.randrange(100) - 1
+            if rng.random() < participants:
+                user_id: int = rng.choice(list(vigil.data['groups'][group_id].hall.keys()))
+            else:
+                user_id: int = 10 ** 9 + rng.randrange(10 ** 6)
+            messages.append(types.Message.to_object({
+                'message_id': n, 'date': int(START.timestamp()),
+                'chat': {'id': group_id, 'type': 'supergroup', 'title': 'Group'},
+                'from': {'id': user_id, 'is_bot': False, 'first_name': 'User'},
+                'text': 'zzz'
+            }))
+        started: float = time.perf_counter()
+        for message in messages:
+            await vigil.handler_update_user(message)
+        seconds: float = time.perf_counter() - started
+        results.append({
+            'messages': len(messages), 'participant_ratio': participants,
+            'messages_per_second': len(messages) / seconds
+        })
+        vigil.persistence.shutdown(wait=True)
+    return results
+
+
+def traced(function) -> tuple:  # (seconds, peak bytes), the timing is taken on a separate untraced run
+    started: float = time.perf_counter()
+    function()
+    seconds: float = time.perf_counter() - started
+    tracemalloc.start()
+    function()
+    peak: int = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return seconds, peak
+
+
+def benchmark_persistence(rng: random.Random, data_path: str, storages: tuple) -> list:
+    results: list = list()
+    for storage in storages:
+        for days in (7, 90):
+            path: str = os.path.join(data_path, '%s-%s' % (storage, days))
+            vigil, bot = make_bot(storage, path + ('.db' if storage == 'sqlite' else '.yaml'))
+            for i in range(10):
+                group: VigilGroup = make_group(-i - 1, 50, len(TIMEZONES), rng)
+                vigil.data['groups'][group.id] = group
+                vigil.attach_group(group)
+                vigil.storage.save_group(group)
+                for user in group.hall.values():
+                    group.notify('hall', user=user)
+                for day in range(days):
+                    date: str = (START - timedelta(days=day)).strftime('%Y/%m/%d')
+                    for j, timezone in enumerate(TIMEZONES[:3]):
+                        group.update_winner(date, '+%04d' % j, VigilWinner(VigilUser(j, START), [timezone]))
+            (dump_seconds, dump_peak) = traced(vigil.dump_data)
+            vigil.persistence.shutdown(wait=True)
+            (load_seconds, load_peak) = traced(vigil.load_data)
+            results.append({
+                'storage': storage, 'groups': 10, 'days_of_winners': days,
+                'dump_seconds': dump_seconds, 'dump_peak_bytes': dump_peak,
+                'load_seconds': load_seconds, 'load_peak_bytes': load_peak
+            })
+    return results
+
+
+def instance_bytes(factory, count: int) -> float:  # Average traced size of the objects built by factory
+    tracemalloc.start()
+    objects: list = [factory() for _ in range(count)]
+    size: int = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del objects
+    return size / count
+
+
+def benchmark_models(rng: random.Random) -> list:  # Only the objects themselves, attribute values are shared
+    group: VigilGroup = make_group(-1, 1, 1, rng)
+    user: VigilUser = next(iter(group.hall.values()))
+    samples: tuple = (user, VigilWinner(user, [user.timezone]), VigilChatMember(), group)
+    results: list = list()
+    for sample in samples:
+        values: dict = {key: getattr(sample, key) for key in type(sample).__slots__}
+        unslotted: type = type('Unslotted' + type(sample).__name__, (VigilUnslotted,), dict())  # Own shared keys
+
+        def slotted():
+            model = type(sample).__new__(type(sample))
+            for key, value in values.items():
+                setattr(model, key, value)
+            return model
+
+        slotted_bytes: float = instance_bytes(slotted, 10000)
+        dict_bytes: float = instance_bytes(lambda: unslotted(values), 10000)
+        results.append({
+            'model': type(sample).__name__,
+            'slotted_bytes': slotted_bytes,
+            'dict_bytes': dict_bytes,
+            'saved_ratio': 1 - slotted_bytes / dict_bytes
+        })
+    return results
+
+
+async def main(options) -> dict:
+    rng: random.Random = random.Random(options.seed)
+    clock: VigilVirtualClock = VigilVirtualClock(START)
+    VigilClock.source = clock.utcnow
+    data_path: str = tempfile.mkdtemp(prefix='vigil-benchmark-')
+    result: dict = {
+        'python': platform.python_version(),
+        'numpy': numpy.__version__ if numpy else None,  # Without it the batch resolver falls back to find_winner
+        'time': datetime.utcnow().isoformat(),
+        'seed': options.seed,
+        'grouping': benchmark_grouping(rng),
+        'tick': benchmark_tick(rng),
+        'auto_join': benchmark_auto_join(rng),
+        'broadcast_winner': await benchmark_broadcast(rng, data_path),
+        'ingest': await benchmark_ingest(rng, data_path),
+        'persistence': benchmark_persistence(rng, data_path, tuple(options.storage)),
+        'models': benchmark_models(rng)
+    }
+    return result
+
+
+if __name__ == '__main__':
+    parser: argparse.ArgumentParser = argparse.ArgumentParser(description='Offline benchmarks, results as JSON')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--storage', nargs='+', default=['journal', 'sqlite', 'sharded'])
+    parser.add_argument('--output', help='write results to this file instead of stdout')
+    options = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+
+    result: dict = asyncio.run(main(options))
+    if options.output:
+        with open(options.output, 'w') as f:
+            ujson.dump(result, f, indent=2)
+    else:
+        ujson.dump(result, sys.stdout, indent=2)
+        print()
@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+# -*- encoding: utf-8 -*-
+
+import time
+import heapq
+import random
+import asyncio
+import logging
+import argparse
+import tempfile
+
+from aiogram import Bot, types
+from datetime import datetime, timedelta
+from apscheduler.events import EVENT_JOB_EXECUTED, EVENT_JOB_ERROR
+from vigil import VigilBot, VigilClock, VigilOutbox, VigilRateLimiter
+
+TIMEZONES: tuple = (
+    'Asia/Shanghai', 'Asia/Tokyo', 'Asia/Kolkata', 'Europe/London', 'Europe/Berlin', 'America/New_York',
+    'America/Los_Angeles', 'America/Sao_Paulo', 'Australia/Sydney', 'Pacific/Auckland'
+)
+
+
+class VigilVirtualClock(object):
+    def __init__(self, start: datetime):
+        self.now: datetime = start
+
+    def utcnow(self) -> datetime:
+        return self.now
+
+
+class VigilFakeBot(Bot):  # Answers every API call in process and records what would have been sent
+    def __init__(self, token: str, admins: list):
+        super().__init__(token=token)
+        self.admins: list = admins
+        self.sent: list = list()  # (chat ID, text)
+        self.titles: dict = dict()  # Chat ID -> title
+        self.calls: dict = dict()  # API method -> number of calls
+        self.message_id: int = 0
+
+    async def request(self, method: str, data: dict or None = None, files: dict or None = None, **kwargs):
+        data: dict = data or dict()
+        self.calls[method] = self.calls.get(method, 0) + 1
+        if method == 'sendMessage':
+            self.message_id += 1
+            self.sent.append((int(data['chat_id']), data['text']))
+            return {
+                'message_id': self.message_id,
+                'date': int(VigilClock.utcnow().timestamp()),
+                'chat': {'id': int(data['chat_id']), 'type': 'supergroup', 'title': 'Group %s' % data['chat_id']},
+                'text': data['text']
+            }
+        if method == 'setChatTitle':
+            self.titles[int(data['chat_id'])] = data['title']
+            return True
+        if method == 'getChatMember':
+            user_id: int = int(data['user_id'])
+            return {
+                'user': {'id': user_id, 'is_bot': False, 'first_name': 'User %s' % user_id},
+                'status': 'administrator' if user_id in self.admins else 'member'
+            }
+        if method == 'getChat':
+            return {'id': int(data['chat_id']), 'type': 'supergroup', 'title': 'Group %s' % data['chat_id']}
+        if method == 'getMe':
+            return {'id': self.id, 'is_bot': True, 'first_name': 'Vigil', 'username': 'vigil_bot'}
+        return True
+
+
+class VigilSimulation(object):  # Feeds synthetic updates through the real dispatcher while time is fast-forwarded
+    ADMIN: int = 1
+
+    def __init__(
+            self, groups: int = 100,
+            users: int = 20,
+            hours: int = 24,
+            seed: int = 0,
+            storage: str = 'journal',
+            start: datetime = datetime(2026, 1, 1, 12)
+    ):
+        self.random: random.Random = random.Random(seed)
+        self.groups: int = groups
+        self.users: int = users
+        self.start: datetime = start
+        self.end: datetime = start + timedelta(hours=hours)
+        self.clock: VigilVirtualClock = VigilVirtualClock(start)
+        self.storage: str = storage
+        self.data_path: str or None = None
+        self.vigil: VigilBot or None = None
+        self.bot: VigilFakeBot or None = None
+        self.events: list = list()  # Heap of (time, sequence, chat ID, user ID, text)
+        self.sequence: int = 0
+        self.updates: int = 0
+        self.decisions: int = 0
+        self.finished: dict = dict()  # Job ID -> execution event of the last run
+        self.messages: dict = dict()  # (chat ID, user ID, text) -> types.Message, plain messages only
+
+    def push(self, time: datetime, chat_id: int, user_id: int, text: str):
+        self.sequence += 1
+        heapq.heappush(self.events, (time, self.sequence, chat_id, user_id, text))
+
+    def populate(self):
+        for i in range(self.groups):
+            chat_id: int = -1000000 - i
+            self.push(self.start, chat_id, self.ADMIN, '/enable')
+            if i % 2:
+                self.push(self.start, chat_id, self.ADMIN, '/update_mode no_activity')
+                self.push(self.start, chat_id, self.ADMIN, '/update_deadline 30')
+            for j in range(self.users):
+                user_id: int = 1000 + i * self.users + j
+                timezone: str = self.random.choice(TIMEZONES)
+                self.push(self.start + timedelta(seconds=1), chat_id, user_id, '/auto_join %s' % timezone)
+                asleep: datetime = self.start + timedelta(hours=self.random.uniform(6, 24))
+                time: datetime = self.start + timedelta(minutes=self.random.expovariate(1 / 30))
+                while time < asleep:
+                    self.push(time, chat_id, user_id, 'zzz')
+                    time += timedelta(minutes=self.random.expovariate(1 / 30))
+
+    def setup(self):
+        VigilClock.source = self.clock.utcnow
+        self.data_path = tempfile.mkdtemp(prefix='vigil-simulation-')
+        self.bot = VigilFakeBot('1:simulation', [self.ADMIN])
+        Bot.set_current(self.bot)
+        self.vigil = VigilBot(
+            '1:simulation', [self.ADMIN],
+            data_path='%s/%s' % (self.data_path, 'data'),
+            storage=self.storage,
+            bot=self.bot
+        )
+        self.vigil.outbox = VigilOutbox(self.bot, global_rate=1e9, chat_rate=1e9, chat_capacity=int(1e9))
+        self.vigil.member_limiter = VigilRateLimiter(rate=1e9, capacity=int(1e9))
+        self.vigil.scheduler.start(paused=True)  # Due jobs are handed to its executor by run_job instead
+        self.vigil.scheduler.add_listener(self.handle_job_done, EVENT_JOB_EXECUTED | EVENT_JOB_ERROR)
+        self.vigil.register_handlers()
+
+    def next_match(self) -> tuple:
+        job = next((job for job in self.vigil.scheduler.get_jobs() if job.id.startswith('match:')), None)  # Sorted
+        if not job:
+            return None, None
+        return job.next_run_time.replace(tzinfo=None) - job.next_run_time.utcoffset(), job
+
+    def handle_job_done(self, event):  # Added after the listeners of the bot, so the next match is planned already
+        self.finished[event.job_id] = event
+
+    async def run_job(self, job):  # Same as the scheduler with a due job, except for the clock
+        scheduler = self.vigil.scheduler
+        scheduler._lookup_executor(job.executor).submit_job(job, [job.next_run_time])
+        scheduler.remove_job(job.id)  # Date jobs have no next run time
+        while job.id not in self.finished.keys():
+            await asyncio.sleep(0)
+        event = self.finished.pop(job.id)
+        if event.exception:
+            raise event.exception
+
+    async def settle(self):  # Lets call_soon planning and the outbox catch up
+        for _ in range(3):
+            await asyncio.sleep(0)
+
+    async def send(self, chat_id: int, user_id: int, text: str):
+        self.updates += 1
+        message: dict = {
+            'message_id': self.updates,
+            'date': int(self.clock.now.timestamp()),
+            'chat': {'id': chat_id, 'type': 'supergroup', 'title': 'Group %s' % chat_id},
+            'from': {'id': user_id, 'is_bot': False, 'first_name': 'User %s' % user_id},
+            'text': text
+        }
+        if not text.startswith('/'):  # Skips the command filters of the dispatcher, they would dominate the run time
+            if (chat_id, user_id, text) not in self.messages.keys():  # Only the sender is read, parsed once
+                self.messages[(chat_id, user_id, text)] = types.Message.to_object(message)
+            await self.vigil.handler_update_user(self.messages[(chat_id, user_id, text)])
+            return
+        message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split(' ')[0])}]
+        await self.vigil.dispatcher.process_update(types.Update.to_object({'update_id': self.updates, 'message': message}))
+
+    async def run(self) -> dict:
+        self.setup()
+        self.populate()
+        started: float = time.perf_counter()
+        while True:
+            await self.settle()
+            (match_time, job) = self.next_match()
+            message_time: datetime or None = self.events[0][0] if self.events else None
+            if (match_time is not None) and ((message_time is None) or (match_time <= message_time)):
+                if match_time > self.end:
+                    break
+                self.clock.now = max(self.clock.now, match_time)
+                self.decisions += 1
+                await self.run_job(job)
+                continue
+            if (message_time is None) or (message_time > self.end):
+                break
+            (message_time, _, chat_id, user_id, text) = heapq.heappop(self.events)
+            self.clock.now = max(self.clock.now, message_time)
+            await self.send(chat_id, user_id, text)
+        while self.vigil.outbox.queue and (not self.vigil.outbox.queue.empty()):
+            await asyncio.sleep(0)
+        await asyncio.sleep(0.01)
+        elapsed: float = time.perf_counter() - started
+        self.vigil.scheduler.shutdown(wait=False)
+        self.vigil.persistence.shutdown(wait=True)
+        self.vigil.dump_data()
+        return {
+            'virtual_hours': (self.end - self.start).total_seconds() / 3600,
+            'seconds': round(elapsed, 3),
+            'groups': self.groups,
+            'users': self.groups * self.users,
+            'updates': self.updates,
+            'decisions': self.decisions,
+            'winners': sum(group.stats.matches for group in self.vigil.data['groups'].values()),
+            'messages_sent': len(self.bot.sent),
+            'api_calls': self.bot.calls,
+            'data_path': self.data_path
+        }
+
+
+if __name__ == '__main__':
+    parser: argparse.ArgumentParser = argparse.ArgumentParser(description='Fast-forward Vigil through synthetic nights')
+    parser.add_argument('--groups', type=int, default=100)
+    parser.add_argument('--users', type=int, default=20, help='users per group')
+    parser.add_argument('--hours', type=int, default=24)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--storage', choices=('journal', 'sqlite', 'sharded'), default='journal')
+    parser.add_argument('--verbose', action='store_true')
+    options = parser.parse_args()
+    logging.getLogger().setLevel(logging.INFO if options.verbose else logging.WARNING)
+
+    simulation: VigilSimulation = VigilSimulation(
+        groups=options.groups, users=options.users, hours=options.hours, seed=options.seed, storage=options.storage
+    )
+    result: dict = asyncio.run(simulation.run())
+    for key, value in result.items():
+        print('%s: %s' % (key, value))
@@ -0,0 +1,539 @@
+import asyncio
+import os
+import queue
+import random
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+from aiogram import Bot, types, utils
+
+from simulate import VigilFakeBot, TIMEZONES
+from vigil import (
+    VigilArchive, VigilBot, VigilChatMember, VigilClock, VigilFront, VigilGroup, VigilJournal, VigilMemberCache,
+    VigilMode, VigilOutbox, VigilPermissionCache, VigilResolver, VigilShard, VigilStats, VigilStorage, VigilTime,
+    VigilUser, VigilWinner, numpy
+)
+
+
+def make_vigil(storage: str = 'journal', **options) -> VigilBot:  # On a fake bot, in a fresh directory
+    bot: VigilFakeBot = VigilFakeBot('1:fake', [1])
+    Bot.set_current(bot)
+    data_path: str = os.path.join(tempfile.mkdtemp(), VigilStorage.backend(storage).default_path)
+    return VigilBot('1:fake', [1], data_path=data_path, storage=storage, bot=bot, **options)
+
+
+def test_catch_up_after_downtime():
+    async def run():
+        vigil: VigilBot = make_vigil()
+        utc_now: datetime = VigilClock.utcnow()
+        for group_id in range(-1, -4, -1):
+            group: VigilGroup = VigilGroup(group_id, enabled=True, mode=VigilMode(VigilMode.LAST))
+            for (user_id, timezone) in enumerate(TIMEZONES):
+                group.hall[user_id] = VigilUser(user_id, utc_now - timedelta(hours=30), timezone=timezone)
+            group.reset_index()
+            vigil.data['groups'][group.id] = group
+            vigil.attach_group(group)
+        vigil.data['checkpoint'] = utc_now - timedelta(hours=30)  # Down for more than a day
+        vigil.schedule_jobs()
+        vigil.scheduler.start()  # Overdue match jobs are run by the real scheduler
+        try:
+            assert vigil.is_behind()
+            await asyncio.wait_for(vigil.catch_up(), 60)
+            replays: int = vigil.metrics.counters.get(('match_replays', 'job', 'run_match'), 0)
+            assert replays > len(vigil.data['groups'])  # Replayed past the first missed decision of each group
+            assert vigil.metrics.counters.get(('job_overruns', 'job', 'match'), 0) == 0
+            for group in vigil.data['groups'].values():
+                job = vigil.scheduler.get_job('match:%d' % group.id)
+                assert job is None or job.args[1] > VigilClock.utcnow()  # Nothing overdue is left
+            assert not vigil.running_matches
+            assert not vigil.is_behind()
+        finally:
+            await vigil.on_shutdown(None)
+
+    asyncio.run(run())
+
+
+def test_first_sharded_start_imports_journal_once():
+    data_path: str = os.path.join(tempfile.mkdtemp(), 'data')
+    journal: VigilJournal = VigilJournal(data_path + '.yaml')  # Left by the default backend
+    data: dict = journal.load()
+    data['admins'] = [1]
+    for group_id in range(-1, -9, -1):
+        data['groups'][group_id] = VigilGroup(group_id)
+    journal.compact(journal.snapshot(data))
+    front: VigilFront = VigilFront('1:fake', [1], 3, storage='sharded', data_path=data_path)
+    front.prepare_shards()
+    loaded: list = list()
+    for index in range(front.workers):
+        shard: dict = VigilStorage.create('sharded', front.get_path(index)).load()
+        group_ids: list = list(shard['groups'].keys()) + list(shard['groups'].unloaded)  # Dormant ones included
+        assert all(VigilShard.owner(group_id, front.workers) == index for group_id in group_ids)
+        assert shard['admins'] == [1]
+        loaded += group_ids
+    assert sorted(loaded) == sorted(data['groups'].keys())  # Each group in exactly one shard
+
+
+@pytest.mark.skipif(numpy is None, reason='the vectorized resolver needs numpy')
+def test_vectorized_resolver_matches_reference():
+    rng: random.Random = random.Random(0)
+    for mode in (VigilMode.LAST, VigilMode.NO_ACTIVITY):
+        for hour in range(24):
+            decision_time: datetime = datetime(2026, 3, 29, hour, rng.choice((0, 30)))
+            template: list = list()
+            for group_id in range(-1, -13, -1):
+                group: VigilGroup = VigilGroup(
+                    group_id, enabled=True, mode=VigilMode(mode), deadline=30 if mode == VigilMode.NO_ACTIVITY else 7
+                )
+                for user_id in range(rng.choice((1, 2, 10))):
+                    last_active: datetime = decision_time - timedelta(minutes=rng.choice((1, 15, 15, 45, 90)))
+                    group.hall[user_id] = VigilUser(user_id, last_active, timezone=rng.choice(TIMEZONES))
+                template.append(group)
+            outcomes: list = list()
+            for resolver in (VigilResolver(), VigilResolver(vectorized=True)):
+                groups: list = list()
+                for group in template:  # Fresh copies, a winner empties the hall
+                    copy: VigilGroup = VigilGroup.from_dict(group.to_dict())
+                    copy.reset_index()
+                    groups.append(copy)
+                resolver.resolve(groups, decision_time)
+                outcomes.append([(group.to_dict()['winners'], sorted(group.hall.keys())) for group in groups])
+            assert outcomes[0] == outcomes[1], (mode, decision_time)
+
+
+def test_sqlite_loads_dormant_groups_on_demand():
+    data_path: str = os.path.join(tempfile.mkdtemp(), 'data.db')
+    storage: VigilStorage = VigilStorage.create('sqlite', data_path)
+    dormant: VigilGroup = VigilGroup(-1)
+    active: VigilGroup = VigilGroup(-2, enabled=True)
+    storage.import_data({'admins': [1], 'groups': {dormant.id: dormant, active.id: active}})
+    groups: dict = VigilStorage.create('sqlite', data_path).load()['groups']
+    assert list(groups.keys()) == [active.id]
+    assert groups.unloaded == {dormant.id}
+    assert groups.get(dormant.id).to_dict() == dormant.to_dict()
+    assert not groups.unloaded
+
+
+def test_outbox_reports_failed_deliveries(caplog):
+    class VigilFailingBot(object):
+        def __init__(self):
+            self.calls: int = 0
+
+        async def send_message(self, chat_id: int, text: str):
+            self.calls += 1
+            if text == 'flood':
+                raise utils.exceptions.RetryAfter(0)
+            raise ValueError(text)
+
+    async def run():
+        bot: VigilFailingBot = VigilFailingBot()
+        outbox: VigilOutbox = VigilOutbox(bot, global_rate=1e9, chat_rate=1e9, chat_capacity=int(1e9), max_retries=2)
+        assert await asyncio.wait_for(outbox.send_message(-1, 'flood', VigilOutbox.STATUS), 5) is None
+        assert bot.calls == 3
+        with pytest.raises(ValueError):
+            await asyncio.wait_for(outbox.send_message(-1, 'broken', VigilOutbox.STATUS), 5)
+        assert await asyncio.wait_for(outbox.send_message(-2, 'flood', VigilOutbox.STATUS), 5) is None  # Still running
+        outbox.task.cancel()
+
+    asyncio.run(run())
+    assert 'dropped after 2 retries' in caplog.text
+
+
+def test_outbox_lane_lets_winners_in_first():
+    class VigilSlowBot(object):
+        def __init__(self):
+            self.sent: list = list()
+            self.gate: asyncio.Event = asyncio.Event()
+
+        async def send_message(self, chat_id: int, text: str):
+            if not self.sent:
+                await self.gate.wait()  # Holds the lane of the chat
+            self.sent.append(text)
+
+    async def run():
+        bot: VigilSlowBot = VigilSlowBot()
+        outbox: VigilOutbox = VigilOutbox(bot, global_rate=1e9, chat_rate=1e9, chat_capacity=int(1e9))
+        futures: list = [outbox.send_message(-1, 'first', VigilOutbox.STATUS)]
+        await asyncio.sleep(0.01)
+        futures += [outbox.send_message(-1, 'status %s' % i, VigilOutbox.STATUS) for i in range(2)]
+        await asyncio.sleep(0.01)  # Both are waiting on the lane
+        futures.append(outbox.send_message(-1, 'winner', VigilOutbox.WINNER))
+        await asyncio.sleep(0.01)
+        bot.gate.set()
+        await asyncio.wait_for(asyncio.gather(*futures), 5)
+        outbox.task.cancel()
+        assert bot.sent == ['first', 'winner', 'status 0', 'status 1']
+
+    asyncio.run(run())
+
+
+def test_winner_announced_once_by_concurrent_broadcasts():
+    async def run():
+        vigil: VigilBot = make_vigil()
+        utc_now: datetime = VigilClock.utcnow()
+        group: VigilGroup = VigilGroup(-1, enabled=True)
+        group.update_winner(utc_now.strftime('%Y/%m/%d'), '+0000', VigilWinner(VigilUser(1, utc_now), ['Etc/UTC']))
+        vigil.data['groups'][group.id] = group
+        vigil.attach_group(group)
+        sent: list = list()
+        vigil.outbox.send_message = lambda chat_id, text, priority, **kwargs: sent.append(text)
+
+        async def get_member_name(user_id: int, group_id: int) -> VigilChatMember:  # Slow, like the API
+            await asyncio.sleep(0.01)
+            return VigilChatMember()
+
+        vigil.get_member_name = get_member_name
+        await asyncio.gather(*[vigil.broadcast_group_winner(group, utc_now) for _ in range(2)])
+        assert len(sent) == 1
+        await vigil.on_shutdown(None)
+
+    asyncio.run(run())
+
+
+def test_my_status_of_all_workers_sent_as_one_reply():
+    async def run():
+        data_path: str = os.path.join(tempfile.mkdtemp(), 'data.yaml')
+        front: VigilFront = VigilFront('1:fake', [1], 2, data_path=data_path)
+        front.bot = VigilFakeBot('1:fake', [1])
+        front.events = queue.Queue()
+        workers: list = list()
+        for index in range(front.workers):
+            bot: VigilFakeBot = VigilFakeBot('1:fake', [1])
+            shard: VigilShard = VigilShard(index, front.workers, queue.Queue(), front.events)
+            workers.append(VigilBot('1:fake', [1], data_path=front.get_path(index), bot=bot, shard=shard))
+            workers[-1].register_handlers()
+        front.inboxes = [worker.shard.inbox for worker in workers]
+        serving: list = [asyncio.get_event_loop().create_task(worker.serve_shard()) for worker in workers]
+        await front.wait_for_workers()
+        for (index, worker) in enumerate(workers):  # One group with the user on each worker
+            group_id: int = next(group_id for group_id in range(-1, -100, -1) if VigilShard.owner(group_id, 2) == index)
+            group: VigilGroup = VigilGroup(group_id, enabled=True)
+            group.hall[5] = VigilUser(5, VigilClock.utcnow(), timezone='Asia/Tokyo')
+            worker.data['groups'][group.id] = group
+            worker.attach_group(group)
+        update: types.Update = types.Update.to_object({'update_id': 1, 'message': {
+            'message_id': 1, 'date': 1, 'chat': {'id': 5, 'type': 'private'}, 'text': '/my_status',
+            'from': {'id': 5, 'is_bot': False, 'first_name': 'User'},
+            'entities': [{'type': 'bot_command', 'offset': 0, 'length': 10}]
+        }})
+        types.Update.set_current(update)
+        await front.route_update(update.message)
+        for _ in range(100):
+            if front.bot.sent:
+                break
+            await asyncio.sleep(0.05)
+        await asyncio.sleep(0.1)
+        assert len(front.bot.sent) == 1
+        assert front.bot.sent[0][1].count('Asia/Tokyo') == 2
+        assert not any(worker.bot.sent for worker in workers)
+        await front.on_shutdown(None)
+        await asyncio.gather(*serving)
+
+    asyncio.run(run())
+
+
+def test_worker_rate_limits_split_among_workers():
+    shard: VigilShard = VigilShard(0, 4, queue.Queue(), queue.Queue())
+    data_path: str = os.path.join(tempfile.mkdtemp(), 'data.yaml')
+    worker: VigilBot = VigilBot('1:fake', [1], data_path=data_path, bot=VigilFakeBot('1:fake', [1]), shard=shard)
+    assert worker.member_limiter.rate == VigilBot.MEMBER_RATE / 4
+    assert worker.outbox.global_limiter.rate == VigilOutbox.GLOBAL_RATE / 4
+
+
+def test_list_render_cached_only_when_complete_and_current():
+    async def run():
+        vigil: VigilBot = make_vigil()
+        group: VigilGroup = VigilGroup(-1, enabled=True)
+        for user_id in (1, 2):
+            group.hall[user_id] = VigilUser(user_id, VigilClock.utcnow(), timezone='Asia/Tokyo')
+        vigil.data['groups'][group.id] = group
+        vigil.attach_group(group)
+        message: types.Message = types.Message.to_object({
+            'message_id': 1, 'date': 1, 'chat': {'id': group.id, 'type': 'supergroup', 'title': 'Group'},
+            'from': {'id': 1, 'is_bot': False, 'first_name': 'User'}, 'text': '/list'
+        })
+        behavior: dict = {'clear': False, 'known': True}
+
+        async def get_member_names(user_ids: list, group_id: int) -> list:
+            await asyncio.sleep(0.01)
+            if behavior['clear']:  # A name changed meanwhile
+                group.clear_renders()
+            if not behavior['known']:  # Lookups failed
+                return [VigilChatMember() for _ in user_ids]
+            return [VigilChatMember(types.User(id=user_id, first_name='User %s' % user_id)) for user_id in user_ids]
+
+        vigil.get_member_names = get_member_names
+        for (clear, known, cached) in ((True, True, False), (False, False, False), (False, True, True)):
+            group.clear_renders()
+            behavior.update(clear=clear, known=known)
+            await vigil.handler_list(message)
+            assert (('list', '') in group.get_renders().keys()) == cached, (clear, known)
+        assert 'User 2' in group.get_renders()[('list', '')]
+        await vigil.on_shutdown(None)
+
+    asyncio.run(run())
+
+
+def test_journal_replay_and_compaction():
+    async def run():
+        vigil: VigilBot = make_vigil()
+        utc_now: datetime = VigilClock.utcnow()
+        vigil.add_group(-1)
+        group: VigilGroup = vigil.get_group(-1)
+        group.enabled = True
+        vigil.update_group(group)
+        for user_id in (1, 2):
+            group.update_hall(VigilUser(user_id, utc_now - timedelta(hours=1), timezone='Asia/Tokyo'))
+        group.update_activity(group.get_user(1), utc_now)
+        group.remove_user(2)
+        group.update_auto_join(VigilUser(3, utc_now, timezone='Europe/Berlin'))
+        group.update_winner(utc_now.strftime('%Y/%m/%d'), '+0900', VigilWinner(group.get_user(1), ['Asia/Tokyo']))
+        vigil.add_admin(9)
+        vigil.data['checkpoint'] = utc_now
+        await vigil.flush_data()
+        return vigil.data_path, group.to_dict()
+
+    (data_path, expected) = asyncio.run(run())
+    assert os.path.getsize(data_path + '.journal') > 0
+    journal: VigilJournal = VigilJournal(data_path)
+    data: dict = journal.load()
+    assert journal.records > 0  # Replayed on top of the snapshot written at startup
+    assert data['groups'][-1].to_dict() == expected
+    assert sorted(data['admins']) == [1, 9]
+    assert data['checkpoint'] is not None
+    journal.compact(journal.snapshot(data))
+    journal.file.close()
+    assert os.path.getsize(data_path + '.journal') == 0
+    compacted: VigilJournal = VigilJournal(data_path)
+    reloaded: dict = compacted.load()
+    assert compacted.records == 0
+    assert reloaded['groups'][-1].to_dict() == expected
+    assert sorted(reloaded['admins']) == [1, 9]
+    assert reloaded['checkpoint'] == data['checkpoint']
+
+
+def make_winning_group() -> VigilGroup:  # Four nights, won three times by user 1
+    group: VigilGroup = VigilGroup(-1, enabled=True)
+    wins: list = [  # (date, offset, user ID, last online in UTC)
+        ('2026/01/01', '+0000', 1, datetime(2026, 1, 1, 23, 50)),
+        ('2026/01/02', '+0000', 1, datetime(2026, 1, 2, 0, 10)),
+        ('2026/01/03', '+0000', 2, datetime(2026, 1, 3, 2, 0)),
+        ('2026/01/04', '+0000', 1, datetime(2026, 1, 4, 1, 0))
+    ]
+    for (date, offset, user_id, last_online) in wins:
+        group.update_winner(date, offset, VigilWinner(VigilUser(user_id, last_online), ['Etc/UTC']))
+    return group
+
+
+def test_stats_updated_with_every_winner_and_persisted():
+    group: VigilGroup = make_winning_group()
+    winner: VigilWinner = group.search_winner_record('+0000', '2026/01/04')
+    winner.broadcasted = True
+    group.update_winner('2026/01/04', '+0000', winner)  # Only the broadcast status changed, not counted again
+    stats: VigilStats = group.stats
+    assert stats.matches == 4
+    assert stats.offsets == {'+0000': 4}
+    assert stats.top(2) == [(1, 3), (2, 1)]
+    assert stats.users[1][3:] == [1, 2]  # Streak broken on the 3rd, best of 2 days
+    assert stats.best_streak == [1, 2]
+    assert VigilStats.average_time(stats.users[1][1], stats.users[1][0]) == '00:20'  # Around midnight
+    assert VigilStats.average_time(stats.minutes, stats.matches) == '00:45'
+    assert stats.current_streak(1, '2026/01/05') == 1
+    assert stats.current_streak(1, '2026/01/06') == 0
+    assert VigilStats.build(group.query_winners('', '~')).to_dict() == stats.to_dict()
+    assert VigilStats.from_dict(stats.to_dict()).to_dict() == stats.to_dict()
+    journal: VigilJournal = VigilJournal(os.path.join(tempfile.mkdtemp(), 'data.yaml'))
+    journal.import_data({'admins': [], 'groups': {group.id: group}})
+    assert VigilJournal(journal.data_path).load()['groups'][group.id].stats.to_dict() == stats.to_dict()
+
+
+def test_stats_and_leaderboard_commands():
+    async def run():
+        vigil: VigilBot = make_vigil()
+        group: VigilGroup = make_winning_group()
+        vigil.data['groups'][group.id] = group
+        vigil.attach_group(group)
+        vigil.register_handlers()
+        for (update_id, text) in enumerate(('/stats', '/leaderboard'), start=1):
+            await vigil.dispatcher.process_update(types.Update.to_object({'update_id': update_id, 'message': {
+                'message_id': update_id, 'date': 1, 'chat': {'id': group.id, 'type': 'supergroup', 'title': 'Group'},
+                'from': {'id': 1, 'is_bot': False, 'first_name': 'User'}, 'text': text,
+                'entities': [{'type': 'bot_command', 'offset': 0, 'length': len(text)}]
+            }}))
+        (stats, leaderboard) = [text for (chat_id, text) in vigil.bot.sent]
+        assert vigil.strings.STATS_GROUP.format(matches=4, time='00:45') in stats
+        assert vigil.strings.STATS_OFFSET.format(offset='+0000', number=4) in stats
+        names: list = [(await vigil.get_member_name(user_id, group.id)).name for user_id in (1, 2)]
+        assert leaderboard == '\n'.join([
+            vigil.strings.LEADERBOARD_MEMBER.format(rank=1, name=names[0], wins=3),
+            vigil.strings.LEADERBOARD_MEMBER.format(rank=2, name=names[1], wins=1)
+        ]) + '\n'
+        await vigil.on_shutdown(None)
+
+    asyncio.run(run())
+
+
+def test_old_winners_archived_and_still_queried():
+    async def run():
+        vigil: VigilBot = make_vigil(winner_retention=3)
+        utc_now: datetime = VigilClock.utcnow()
+        vigil.add_group(-1)
+        group: VigilGroup = vigil.get_group(-1)
+        dates: list = [(utc_now - timedelta(days=days)).strftime('%Y/%m/%d') for days in (40, 10, 1, 0)]
+        for (user_id, date) in enumerate(dates, start=1):
+            group.update_winner(date, '+0000', VigilWinner(VigilUser(user_id, utc_now), ['Etc/UTC']))
+        await vigil.archive_winners()
+        assert sorted(group.winners.keys()) == dates[2:]  # Yesterday is kept, it may not be broadcast yet
+        months: set = {VigilArchive.month_of(date) for date in dates[:2]}
+        assert all(os.path.isfile(vigil.archive.file_path(group.id, month)) for month in months)
+        records: list = await vigil.query_winners(group, '', '~')
+        assert [(date, winner.id) for (date, offset, winner) in records] == list(zip(dates, range(1, 5)))
+        assert [date for (date, _, _) in await vigil.query_winners(group, dates[1], dates[1])] == [dates[1]]
+        assert group.stats.matches == 4  # Archiving does not change the statistics
+        await vigil.flush_data()
+        assert sorted(VigilJournal(vigil.data_path).load()['groups'][-1].winners.keys()) == dates[2:]
+        await vigil.on_shutdown(None)
+
+    asyncio.run(run())
+
+
+def test_auto_join_enrolls_due_timezones_and_persists_resets():
+    async def run():
+        vigil: VigilBot = make_vigil()
+        utc_now: datetime = VigilClock.utcnow()
+        vigil.add_group(-1)
+        group: VigilGroup = vigil.get_group(-1)
+        group.update_hall(VigilUser(3, utc_now - timedelta(days=2), timezone='Asia/Tokyo'))  # Joined long ago
+        for (user_id, timezone) in ((1, 'Asia/Tokyo'), (2, 'Europe/Berlin'), (3, 'Asia/Tokyo')):
+            group.update_auto_join(VigilUser(user_id, utc_now - timedelta(days=1), timezone=timezone))
+        join_time: datetime = VigilGroup.next_local_time('Asia/Tokyo', *group.get_auto_join_time(), utc_now)
+        group.apply_auto_join(join_time)
+        assert sorted(group.hall.keys()) == [1, 3]  # Not yet the time of Berlin
+        assert list(group.get_timezone_index().keys()) == ['Asia/Tokyo']
+        assert all(user.last_active == join_time for user in group.hall.values())
+        await vigil.flush_data()
+        hall: dict = VigilJournal(vigil.data_path).load()['groups'][-1].hall
+        assert {user_id: user.last_active for (user_id, user) in hall.items()} == {1: join_time, 3: join_time}
+        await vigil.on_shutdown(None)
+
+    asyncio.run(run())
+
+
+@pytest.mark.parametrize('storage', ['journal', 'sqlite', 'sharded'])
+def test_persistence_bytes_measured_per_flush(storage: str):
+    async def run():
+        vigil: VigilBot = make_vigil(storage)
+        vigil.add_group(-1)
+        vigil.get_group(-1).update_hall(VigilUser(1, VigilClock.utcnow(), timezone='Asia/Tokyo'))
+        await vigil.flush_data()
+        size: int = vigil.metrics.counters[('persistence_bytes', 'storage', storage)]
+        assert size > 0
+        if storage == 'journal':
+            assert size == os.path.getsize(vigil.storage.journal_path)
+        assert 'vigil_persistence_bytes_total{storage="%s"} %s' % (storage, size) in vigil.metrics.render()
+        await vigil.on_shutdown(None)
+
+    asyncio.run(run())
+
+
+def test_cached_offset_follows_dst_transitions():
+    transition: datetime = datetime(2026, 3, 29, 1)  # Europe/Berlin springs forward at 01:00 UTC
+    entry: tuple = VigilTime.get_entry('Europe/Berlin', transition - timedelta(minutes=1))
+    assert entry[1] == transition
+    assert VigilTime.get_offset_string('Europe/Berlin', transition - timedelta(seconds=1)) == '+0100'
+    assert VigilTime.get_entry('Europe/Berlin', transition - timedelta(hours=1)) is entry  # Served from the cache
+    assert VigilTime.get_offset('Europe/Berlin', transition) == timedelta(hours=2)
+    assert VigilTime.get_local_time('Europe/Berlin', transition) == datetime(2026, 3, 29, 3)
+    assert VigilTime.get_offset_string('Europe/Berlin', datetime(2026, 10, 25, 1)) == '+0100'  # Back in autumn
+    assert VigilTime.get_offset_string('Europe/Berlin', transition - timedelta(minutes=1)) == '+0100'
+
+
+def test_concurrent_member_lookups_share_one_call():
+    async def run():
+        calls: list = list()
+        release: asyncio.Event = asyncio.Event()
+
+        async def fetch(group_id: int, user_id: int) -> types.ChatMember:
+            calls.append((group_id, user_id))
+            await release.wait()
+            return types.ChatMember(user=types.User(id=user_id, first_name='User %s' % user_id), status='member')
+
+        cache: VigilMemberCache = VigilMemberCache(fetch)
+        lookups: asyncio.Future = asyncio.gather(*(cache.get(-1, 1) for _ in range(5)))
+        await asyncio.sleep(0)
+        release.set()
+        members: list = await lookups
+        assert calls == [(-1, 1)]
+        assert all(member is members[0] for member in members) and (members[0].name == 'User 1')
+        assert (await cache.get(-1, 1)) is members[0]  # Cached afterwards
+        assert calls == [(-1, 1)]
+        assert cache.get_stats()['coalesced'] == 4
+
+    asyncio.run(run())
+
+
+def test_permission_cache_entries_expire(monkeypatch):
+    async def run():
+        now: list = [datetime(2026, 1, 1)]
+        monkeypatch.setattr(VigilClock, 'source', lambda: now[0])
+        statuses: list = ['administrator', 'member', None]
+        calls: list = list()
+
+        async def fetch(group_id: int, user_id: int) -> types.ChatMember:
+            calls.append(user_id)
+            status: str or None = statuses[len(calls) - 1]
+            if status is None:
+                raise utils.exceptions.BadRequest('User not found')
+            return types.ChatMember(user=types.User(id=user_id, first_name='User %s' % user_id), status=status)
+
+        cache: VigilPermissionCache = VigilPermissionCache(fetch)
+        assert await cache.get(-1, 1)
+        now[0] += timedelta(minutes=4)
+        assert await cache.get(-1, 1)  # Still cached
+        assert len(calls) == 1
+        now[0] += timedelta(minutes=2)
+        assert not await cache.get(-1, 1)  # Expired after 5 minutes, demoted meanwhile
+        assert len(calls) == 2
+        now[0] += timedelta(minutes=5)
+        assert not await cache.get(-1, 1)  # Failed lookup, cached for a minute only
+        now[0] += timedelta(seconds=30)
+        assert not await cache.get(-1, 1)
+        assert len(calls) == 3
+        statuses.append('creator')
+        now[0] += timedelta(seconds=31)
+        assert await cache.get(-1, 1)
+        assert len(calls) == 4
+
+    asyncio.run(run())
+
+
+def test_non_participant_messages_skip_group_lookup(monkeypatch):
+    async def run():
+        vigil: VigilBot = make_vigil()
+        group: VigilGroup = VigilGroup(-1, enabled=True)
+        group.hall[1] = VigilUser(1, VigilClock.utcnow(), timezone='Asia/Tokyo')
+        vigil.data['groups'][group.id] = group
+        vigil.attach_group(group)
+        vigil.index_participants()
+        vigil.register_handlers()
+        lookups: list = list()
+        get_group = vigil.get_group
+
+        def recorded_get_group(group_id: int, follow_redir: bool = False) -> VigilGroup or None:
+            lookups.append(group_id)
+            return get_group(group_id, follow_redir)
+
+        monkeypatch.setattr(vigil, 'get_group', recorded_get_group)
+        for (update_id, (chat_id, user_id)) in enumerate(((-1, 2), (-2, 1), (-1, 1)), start=1):
+            await vigil.dispatcher.process_update(types.Update.to_object({'update_id': update_id, 'message': {
+                'message_id': update_id, 'date': 1, 'chat': {'id': chat_id, 'type': 'supergroup', 'title': 'Group'},
+                'from': {'id': user_id, 'is_bot': False, 'first_name': 'User'}, 'text': 'Hello'
+            }}))
+            assert lookups == ([-1] if user_id == 1 and chat_id == -1 else [])  # Only the participant gets there
+        await vigil.on_shutdown(None)
+
+    asyncio.run(run())
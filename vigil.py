@@ -2,17 +2,42 @@
 # -*- encoding: utf-8 -*-
 
 import os
+import ssl
+import copy
+import gzip
+import heapq
+import signal
+import shutil
+import time
 import pytz
 import yaml
+import ujson
+import sqlite3
+import queue
+import bisect
 import asyncio
 import logging
+import calendar
+import multiprocessing
 
+from array import array
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from aiohttp import web
 from aiogram import Bot, Dispatcher, executor, types, utils
 from aiogram.types.message import ContentType
+from aiogram.dispatcher.webhook import SendMessage
 from datetime import datetime, timedelta
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from apscheduler.events import EVENT_JOB_MISSED, EVENT_JOB_MAX_INSTANCES, EVENT_JOB_EXECUTED, EVENT_JOB_ERROR
+
+try:
+    import numpy
+except ImportError:  # Optional, winners are then decided group by group
+    numpy = None
 
 CONFIG_PATH = 'config.yaml'
+YAML_DUMPER = getattr(yaml, 'CSafeDumper', yaml.SafeDumper)  # libyaml when available, the records are plain data
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -80,11 +105,113 @@ class VigilStrings(object):
     I_AM_AWAKE_RESPONSE: str = '我活了'
     LIST_MEMBER: str = '"{name}"，属于 {timezone} 赛区'
     MY_STATUS_MEMBER: str = '你在 {group_name} 群参加了 {timezone} 赛区的大赛'
+    LEADERBOARD_MEMBER: str = '{rank}. "{name}"，夺冠 {wins} 次'
+    STATS_GROUP: str = '本群共决出 {matches} 位冠军，平均于当地时间 {time} 决出'
+    STATS_OFFSET: str = '{offset} offset 的赛区决出 {number} 位冠军'
+    STATS_STREAK: str = '最长连胜纪录由 "{name}" 保持，连续 {streak} 天夺冠'
+    STATS_USER: str = '你共夺冠 {wins} 次，当前连胜 {streak} 天，最长连胜 {best_streak} 天，平均于当地时间 {time} 夺冠'
+    STATS_EMPTY: str = '还没有决出过冠军'
+    DEBUG_UPTIME: str = '已运行 {uptime}'
+    DEBUG_SECTION: str = '[{section}]'
+    DEBUG_LATENCY: str = '{name}：{count} 次，平均 {average:.1f} ms，P95 ≤ {p95} ms，出错 {errors} 次'
+    DEBUG_VALUE: str = '{name}：{value}'
+
+
+class VigilClock(object):  # Current UTC time as seen by everything in here, simulations replace the source
+    source = datetime.utcnow
+
+    EPOCH: datetime = datetime(1970, 1, 1)
+
+    @classmethod
+    def utcnow(cls) -> datetime:
+        return cls.source()
+
+    @classmethod
+    def to_epoch(cls, time: datetime) -> float:
+        return (time - cls.EPOCH).total_seconds()
+
+    @classmethod
+    def from_epoch(cls, epoch: float) -> datetime:
+        return cls.EPOCH + timedelta(seconds=epoch)
 
 
-class VigilMode(yaml.YAMLObject):
+class VigilTime(object):  # Per-timezone UTC offsets, cached until the next DST transition
+    cache: dict = dict()  # Timezone -> (valid_from, valid_until, offset, offset_string)
+
+    @classmethod
+    def get_entry(cls, timezone: str, utc_now: datetime) -> tuple:
+        entry: tuple or None = cls.cache.get(timezone, None)
+        if entry and (entry[0] <= utc_now < entry[1]):
+            return entry
+        tz: pytz.timezone = pytz.timezone(timezone)
+        transitions: list = getattr(tz, '_utc_transition_times', None) or list()
+        index: int = bisect.bisect_right(transitions, utc_now)
+        valid_from: datetime = transitions[index - 1] if index > 0 else datetime.min
+        valid_until: datetime = transitions[index] if index < len(transitions) else datetime.max
+        localized_time: datetime = pytz.utc.localize(utc_now, is_dst=None).astimezone(tz)
+        entry = (valid_from, valid_until, localized_time.utcoffset(), localized_time.strftime('%z'))
+        cls.cache[timezone] = entry
+        return entry
+
+    @classmethod
+    def get_offset(cls, timezone: str, utc_now: datetime or None = None) -> timedelta:
+        return cls.get_entry(timezone, utc_now or VigilClock.utcnow())[2]
+
+    @classmethod
+    def get_offset_string(cls, timezone: str, utc_now: datetime or None = None) -> str:
+        return cls.get_entry(timezone, utc_now or VigilClock.utcnow())[3]
+
+    @classmethod
+    def get_local_time(cls, timezone: str, utc_now: datetime or None = None) -> datetime:  # Naive local time
+        utc_now: datetime = utc_now or VigilClock.utcnow()
+        return utc_now + cls.get_entry(timezone, utc_now)[2]
+
+
+class VigilModel(yaml.YAMLObject):  # Slotted, serialized as versioned plain dicts, the YAML tags load older data
+    __slots__: tuple = ()
     yaml_loader: yaml.SafeLoader = yaml.SafeLoader
     yaml_dumper: yaml.SafeDumper = yaml.SafeDumper
+
+    VERSION: int = 1  # Layout of the records returned by to_dict()
+
+    def to_dict(self) -> dict:  # Detached from the object, safe to hand over to a worker thread
+        raise NotImplementedError
+
+    @classmethod
+    def from_dict(cls, record: dict):
+        raise NotImplementedError
+
+    @classmethod
+    def from_state(cls, state: dict):  # Attributes of objects dumped with their YAML tag before the versioned records
+        return cls.from_dict(state)
+
+    @classmethod
+    def check_version(cls, record: dict):
+        if record.get('version', 1) > cls.VERSION:  # Records without a version predate the field, same layout
+            raise ValueError('Record of %s is of version %s, newer than this release' % (
+                cls.__name__, record['version']
+            ))
+
+    @classmethod
+    def from_yaml(cls, loader: yaml.SafeLoader, node: yaml.Node):
+        record: dict = loader.construct_mapping(node, deep=True)
+        return cls.from_dict(record) if 'version' in record.keys() else cls.from_state(record)
+
+    @classmethod
+    def to_yaml(cls, dumper: yaml.SafeDumper, data) -> yaml.Node:
+        return dumper.represent_mapping(cls.yaml_tag, data.to_dict())
+
+    def __getstate__(self) -> dict:  # copy and pickle use the same records
+        return self.to_dict()
+
+    def __setstate__(self, state: dict):
+        model: VigilModel = self.from_dict(state)
+        for key in self.__slots__:
+            setattr(self, key, getattr(model, key))
+
+
+class VigilMode(VigilModel):
+    __slots__: tuple = ('mode',)
     yaml_tag: str = '!VigilMode'
 
     LAST: int = 0  # Last active user at a given time wins
@@ -93,12 +220,21 @@ class VigilMode(yaml.YAMLObject):
     def __init__(self, mode: int):
         self.mode: int = mode
 
+    def to_dict(self) -> dict:
+        return {'version': self.VERSION, 'mode': self.mode}
 
-class VigilUser(yaml.YAMLObject):
-    yaml_loader: yaml.SafeLoader = yaml.SafeLoader
-    yaml_dumper: yaml.SafeDumper = yaml.SafeDumper
+    @classmethod
+    def from_dict(cls, record: dict):
+        cls.check_version(record)
+        return cls(record['mode'])
+
+
+class VigilUser(VigilModel):
+    __slots__: tuple = ('id', 'joined', 'timezone', 'is_dummy', 'last_active', 'message_count', 'recent_activity')
     yaml_tag: str = '!VigilUser'
 
+    HISTORY_SIZE: int = 16  # Number of recent messages kept in recent_activity
+
     def __init__(
             self, user_id: int,
             active: datetime,
@@ -109,24 +245,199 @@ class VigilUser(yaml.YAMLObject):
         self.id: int = user_id
         self.joined: bool = joined
         self.timezone: str = timezone
-        self.active_time: list = list()
-        self.active_time.append(active)
         self.is_dummy: bool = is_dummy
+        self.reset_activity(active)
+
+    def to_dict(self) -> dict:
+        return {
+            'version': self.VERSION,
+            'id': self.id,
+            'joined': self.joined,
+            'timezone': self.timezone,
+            'active': VigilClock.to_epoch(self.last_active),
+            'messages': self.message_count,
+            'recent': self.recent_activity.tolist(),
+            'is_dummy': self.is_dummy
+        }
 
+    @classmethod
+    def from_dict(cls, record: dict):
+        cls.check_version(record)
+        user: VigilUser = cls(
+            record['id'],
+            VigilClock.from_epoch(record['active']),
+            joined=record['joined'],
+            timezone=record['timezone'],
+            is_dummy=record['is_dummy']
+        )
+        if 'messages' in record.keys():
+            user.message_count = record['messages']
+            user.recent_activity = array('q', record['recent'])
+        return user
+
+    @classmethod
+    def from_state(cls, state: dict):
+        active_time: list or None = state.get('active_time', None)
+        user: VigilUser = cls(
+            state['id'],
+            active_time[0] if active_time else state['last_active'],
+            joined=state.get('joined', True),
+            timezone=state.get('timezone', 'Asia/Shanghai'),
+            is_dummy=state.get('is_dummy', False)
+        )
+        if active_time:  # Records written before the compact activity history
+            for time in active_time[1:]:
+                user.update_activity(time)
+        else:
+            user.message_count = state['message_count']
+            user.recent_activity = array('q', state['recent_activity'])
+        return user
+
+    def reset_activity(self, time: datetime):
+        self.last_active: datetime = time
+        self.message_count: int = 0
+        self.recent_activity: array = array('q', bytes(8 * self.HISTORY_SIZE))  # Ring buffer of UTC epochs
+
+    def update_activity(self, time: datetime):
+        self.last_active = time
+        self.recent_activity[self.message_count % self.HISTORY_SIZE] = calendar.timegm(time.utctimetuple())
+        self.message_count += 1
+
+    def get_recent_activity(self) -> list:
+        count: int = min(self.message_count, self.HISTORY_SIZE)
+        start: int = self.message_count - count
+        return [
+            datetime.utcfromtimestamp(self.recent_activity[i % self.HISTORY_SIZE])
+            for i in range(start, self.message_count)
+        ]
 
-class VigilWinner(yaml.YAMLObject):
-    yaml_loader: yaml.SafeLoader = yaml.SafeLoader
-    yaml_dumper: yaml.SafeDumper = yaml.SafeDumper
+
+class VigilWinner(VigilModel):
+    __slots__: tuple = ('id', 'last_online', 'timezones', 'broadcasted')
     yaml_tag: str = '!VigilWinner'
 
     def __init__(self, user: VigilUser, timezones: list, broadcasted: bool = False):
         self.id: int = user.id
-        self.last_online: datetime = user.active_time[len(user.active_time) - 1]
+        self.last_online: datetime = user.last_active
         self.timezones: list = timezones
         self.broadcasted: bool = broadcasted
 
+    @classmethod
+    def create(cls, user_id: int, last_online: datetime, timezones: list, broadcasted: bool):  # Without a VigilUser
+        winner: VigilWinner = cls.__new__(cls)
+        winner.id = user_id
+        winner.last_online = last_online
+        winner.timezones = timezones
+        winner.broadcasted = broadcasted
+        return winner
+
+    def to_dict(self) -> dict:
+        return {
+            'version': self.VERSION,
+            'id': self.id,
+            'last_online': VigilClock.to_epoch(self.last_online),
+            'timezones': list(self.timezones),
+            'broadcasted': self.broadcasted
+        }
+
+    @classmethod
+    def from_dict(cls, record: dict):
+        cls.check_version(record)
+        return cls.create(
+            record['id'], VigilClock.from_epoch(record['last_online']), list(record['timezones']), record['broadcasted']
+        )
+
+    @classmethod
+    def from_state(cls, state: dict):
+        return cls.create(state['id'], state['last_online'], state['timezones'], state.get('broadcasted', False))
+
+
+class VigilStats(VigilModel):  # Aggregates over every winner of a group, updated as winners are decided
+    __slots__: tuple = ('matches', 'minutes', 'offsets', 'users', 'best_streak')
+    yaml_tag: str = '!VigilStats'
+
+    NOON: int = 720  # Times are summed as minutes since local noon, so that 23:50 and 00:10 average to 00:00
+
+    def __init__(self):
+        self.matches: int = 0
+        self.minutes: int = 0
+        self.offsets: dict = dict()  # Offset -> wins
+        self.users: dict = dict()  # User ID -> [wins, minutes, last winning date, streak, best streak]
+        self.best_streak: list = [0, 0]  # User ID, days
+
+    def to_dict(self) -> dict:
+        return {
+            'version': self.VERSION,
+            'matches': self.matches,
+            'minutes': self.minutes,
+            'offsets': dict(self.offsets),
+            'users': [[user_id] + record for user_id, record in self.users.items()],
+            'best_streak': list(self.best_streak)
+        }
+
+    @classmethod
+    def from_dict(cls, record: dict):
+        cls.check_version(record)
+        stats: VigilStats = cls()
+        stats.matches = record['matches']
+        stats.minutes = record['minutes']
+        stats.offsets = dict(record['offsets'])
+        stats.users = {user[0]: list(user[1:]) for user in record['users']}
+        stats.best_streak = list(record['best_streak'])
+        return stats
+
+    @classmethod
+    def from_state(cls, state: dict):
+        return cls.from_dict(dict(state, users=[[user_id] + record for user_id, record in state['users'].items()]))
+
+    @classmethod
+    def build(cls, records: list):  # Records are (date, offset, VigilWinner), in chronological order
+        stats: VigilStats = cls()
+        for (date, offset, winner) in records:
+            stats.add_winner(date, offset, winner)
+        return stats
+
+    @staticmethod
+    def previous_date(date: str) -> str:
+        return (datetime.strptime(date, '%Y/%m/%d') - timedelta(days=1)).strftime('%Y/%m/%d')
+
+    def add_winner(self, date: str, offset: str, winner: VigilWinner):
+        localized_time: datetime = VigilTime.get_local_time(winner.timezones[0], winner.last_online)
+        minutes: int = (localized_time.hour * 60 + localized_time.minute - self.NOON) % 1440
+        self.matches += 1
+        self.minutes += minutes
+        self.offsets[offset] = self.offsets.get(offset, 0) + 1
+        record: list = self.users.setdefault(winner.id, [0, 0, '', 0, 0])
+        record[0] += 1
+        record[1] += minutes
+        if record[2] != date:
+            record[3] = (record[3] + 1) if record[2] == self.previous_date(date) else 1
+            record[2] = date
+        record[4] = max(record[4], record[3])
+        if record[4] > self.best_streak[1]:
+            self.best_streak = [winner.id, record[4]]
+
+    @classmethod
+    def average_time(cls, minutes: int, count: int) -> str:
+        average: int = (minutes // max(count, 1) + cls.NOON) % 1440
+        return '%02d:%02d' % (average // 60, average % 60)
+
+    def top(self, count: int) -> list:  # [(user ID, wins)], most wins first
+        return [
+            (user_id, record[0])
+            for user_id, record in heapq.nlargest(count, self.users.items(), key=lambda x: (x[1][0], -x[0]))
+        ]
+
+    def current_streak(self, user_id: int, today: str) -> int:
+        record: list or None = self.users.get(user_id, None)
+        if (not record) or (record[2] not in (today, self.previous_date(today))):
+            return 0
+        return record[3]
+
 
 class VigilChatMember(object):
+    __slots__: tuple = ('id', 'name', 'username', 'record_time')
+
     def __init__(self, user: types.User = None):
         if user:
             self.id: int = user.id
@@ -136,14 +447,366 @@ class VigilChatMember(object):
             self.id: int = 114514
             self.name: str = "Unknown"
             self.username: str or None = None
-        self.record_time: datetime = datetime.utcnow()
+        self.record_time: datetime = VigilClock.utcnow()
+
+
+class VigilRateLimiter(object):  # Token bucket, shared by every coroutine calling the same API
+    def __init__(self, rate: float, capacity: int):
+        self.rate: float = rate
+        self.capacity: int = capacity
+        self.tokens: float = capacity
+        self.updated: float = time.monotonic()
+        self.lock: asyncio.Lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now: float = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
 
 
-class VigilGroup(yaml.YAMLObject):
-    yaml_loader: yaml.SafeLoader = yaml.SafeLoader
-    yaml_dumper: yaml.SafeDumper = yaml.SafeDumper
+class VigilLane(object):  # Calls to one chat, one at a time, waiting calls are let in by priority then FIFO
+    def __init__(self, limiter: VigilRateLimiter):
+        self.limiter: VigilRateLimiter = limiter
+        self.busy: bool = False
+        self.waiting: list = list()  # Heap of (priority, sequence, asyncio.Future)
+
+    async def acquire(self, priority: int, sequence: int):
+        if not self.busy:
+            self.busy = True
+            return
+        waiter: asyncio.Future = asyncio.get_event_loop().create_future()
+        heapq.heappush(self.waiting, (priority, sequence, waiter))
+        try:
+            await waiter  # Released straight to this call, the lane stays busy
+        except asyncio.CancelledError:
+            if waiter.done() and (not waiter.cancelled()):  # Cancelled once already let in, passed on
+                self.release()
+            raise
+
+    def release(self):
+        while self.waiting:
+            (_, _, waiter) = heapq.heappop(self.waiting)
+            if not waiter.done():  # Skips cancelled calls
+                waiter.set_result(None)
+                return
+        self.busy = False
+
+
+class VigilOutbox(object):  # Outgoing API calls, ordered by priority and paced globally and per chat
+    WINNER: int = 0
+    MATCH: int = 1
+    STATUS: int = 2
+    TITLE: int = 3
+
+    GLOBAL_RATE: float = 25
+
+    def __init__(
+            self, bot: Bot,
+            global_rate: float = GLOBAL_RATE,
+            chat_rate: float = 1 / 3,  # Telegram allows about 20 messages per minute in a group
+            chat_capacity: int = 3,
+            max_retries: int = 3
+    ):
+        self.bot: Bot = bot
+        self.global_limiter: VigilRateLimiter = VigilRateLimiter(global_rate, int(global_rate))
+        self.chat_rate: float = chat_rate
+        self.chat_capacity: int = chat_capacity
+        self.max_retries: int = max_retries
+        self.lanes: dict = dict()  # Chat ID -> VigilLane
+        self.queue: asyncio.PriorityQueue or None = None
+        self.sequence: int = 0  # Keeps FIFO order within a priority
+        self.task: asyncio.Task or None = None
+
+    def submit(self, priority: int, chat_id: int, method: str, *args, **kwargs) -> asyncio.Future:
+        if not self.task:
+            self.queue = asyncio.PriorityQueue()
+            self.task = asyncio.ensure_future(self.run())
+        future: asyncio.Future = asyncio.get_event_loop().create_future()
+        future.add_done_callback(self.consume)  # Most calls are fire and forget
+        self.sequence += 1
+        self.queue.put_nowait((priority, self.sequence, chat_id, method, args, kwargs, future))
+        return future
+
+    def send_message(self, chat_id: int, text: str, priority: int, **kwargs) -> asyncio.Future:
+        return self.submit(priority, chat_id, 'send_message', chat_id, text, **kwargs)
+
+    def set_chat_title(self, chat_id: int, title: str, priority: int = TITLE) -> asyncio.Future:
+        return self.submit(priority, chat_id, 'set_chat_title', chat_id, title)
+
+    @staticmethod
+    def consume(future: asyncio.Future):  # Errors are logged by deliver, not again when an unread future is collected
+        if not future.cancelled():
+            future.exception()
+
+    def get_lane(self, chat_id: int) -> VigilLane:
+        if chat_id not in self.lanes.keys():
+            self.lanes[chat_id] = VigilLane(VigilRateLimiter(self.chat_rate, self.chat_capacity))
+        return self.lanes[chat_id]
+
+    async def run(self):
+        while True:
+            (priority, sequence, chat_id, method, args, kwargs, future) = await self.queue.get()
+            await self.global_limiter.acquire()
+            asyncio.ensure_future(self.deliver(priority, sequence, chat_id, method, args, kwargs, future))
+
+    async def deliver(self, priority: int, sequence: int, chat_id: int, method: str, args: tuple, kwargs: dict,
+                      future: asyncio.Future):
+        lane: VigilLane = self.get_lane(chat_id)
+        await lane.acquire(priority, sequence)  # A winner waiting on a busy chat goes before its status updates
+        try:
+            result = None
+            for attempt in range(self.max_retries + 1):
+                await lane.limiter.acquire()
+                try:
+                    result = await getattr(self.bot, method)(*args, **kwargs)
+                    break
+                except utils.exceptions.RetryAfter as e:
+                    if attempt == self.max_retries:
+                        logger.warning('Call to "%s" in chat "%s" dropped after %s retries' % (
+                            method, chat_id, self.max_retries
+                        ))
+                        break
+                    logger.warning('Flood control exceeded in chat "%s", retrying in %s seconds' % (chat_id, e.timeout))
+                    await asyncio.sleep(e.timeout)
+                except utils.exceptions.TelegramAPIError as e:
+                    logger.warning('Failed to call "%s" in chat "%s": %s' % (method, chat_id, e))
+                    break
+                except Exception as e:  # Handed to the caller, the delivery of other calls goes on
+                    logger.exception('Unexpected error calling "%s" in chat "%s"' % (method, chat_id))
+                    if not future.done():
+                        future.set_exception(e)
+                    return
+        finally:
+            lane.release()
+        if not future.done():
+            future.set_result(result)
+
+
+class VigilMetrics(object):  # Counters and latency histograms, rendered in the Prometheus text format
+    BUCKETS: tuple = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+    def __init__(self):
+        self.started: float = time.time()
+        self.counters: dict = dict()  # (name, label, value) -> count
+        self.histograms: dict = dict()  # (name, label, value) -> [count per bucket..., +Inf, sum, count]
+        self.gauges: dict = dict()  # Name -> (label, callable returning {value: number}), collected on demand
+
+    def inc(self, name: str, label: str, value: str, amount: int = 1):
+        key: tuple = (name, label, value)
+        self.counters[key] = self.counters.get(key, 0) + amount
+
+    def observe(self, name: str, label: str, value: str, seconds: float):
+        key: tuple = (name, label, value)
+        histogram: list or None = self.histograms.get(key, None)
+        if histogram is None:
+            histogram = [0] * (len(self.BUCKETS) + 3)
+            self.histograms[key] = histogram
+        histogram[bisect.bisect_left(self.BUCKETS, seconds)] += 1
+        histogram[-2] += seconds
+        histogram[-1] += 1
+
+    def gauge(self, name: str, label: str, collect):
+        self.gauges[name] = (label, collect)
+
+    def timed(self, name: str, label: str, value: str, function):  # Wraps a coroutine function
+        async def wrapper(*args):
+            started: float = time.perf_counter()
+            try:
+                return await function(*args)
+            except Exception:
+                self.inc(name + '_errors', label, value)
+                raise
+            finally:
+                self.observe(name + '_seconds', label, value, time.perf_counter() - started)
+        wrapper.__name__ = function.__name__
+        return wrapper
+
+    def timed_request(self, request):  # Wraps Bot.request, labelled with the API method
+        async def wrapper(method: str, *args, **kwargs):
+            started: float = time.perf_counter()
+            try:
+                return await request(method, *args, **kwargs)
+            except Exception:
+                self.inc('api_errors', 'method', method)
+                raise
+            finally:
+                self.observe('api_seconds', 'method', method, time.perf_counter() - started)
+        return wrapper
+
+    def quantile(self, histogram: list, q: float) -> float or None:  # Upper bound of the bucket holding it
+        rank: float = q * histogram[-1]
+        seen: int = 0
+        for i, bound in enumerate(self.BUCKETS):
+            seen += histogram[i]
+            if seen >= rank:
+                return bound
+        return None
+
+    def get_histograms(self, name: str) -> list:  # [(value, count, average seconds, p95 bound, errors)]
+        result: list = list()
+        for (histogram_name, label, value), histogram in sorted(self.histograms.items()):
+            if histogram_name != name + '_seconds':
+                continue
+            errors: int = self.counters.get((name + '_errors', label, value), 0)
+            result.append((
+                value, histogram[-1], histogram[-2] / max(histogram[-1], 1), self.quantile(histogram, 0.95), errors
+            ))
+        return result
+
+    def collect_gauges(self) -> list:  # [(name, label, value, number)]
+        result: list = list()
+        for name, (label, collect) in self.gauges.items():
+            for value, number in collect().items():
+                result.append((name, label, value, number))
+        return result
+
+    def render(self) -> str:
+        lines: list = list()
+        for (name, label, value), count in sorted(self.counters.items()):
+            lines.append('vigil_%s_total{%s="%s"} %s' % (name, label, value, count))
+        for (name, label, value), histogram in sorted(self.histograms.items()):
+            cumulative: int = 0
+            for i, bound in enumerate(self.BUCKETS + ('+Inf',)):
+                cumulative += histogram[i]
+                lines.append('vigil_%s_bucket{%s="%s",le="%s"} %s' % (name, label, value, bound, cumulative))
+            lines.append('vigil_%s_sum{%s="%s"} %s' % (name, label, value, histogram[-2]))
+            lines.append('vigil_%s_count{%s="%s"} %s' % (name, label, value, histogram[-1]))
+        for (name, label, value, number) in self.collect_gauges():
+            lines.append('vigil_%s{%s="%s"} %s' % (name, label, value, number))
+        lines.append('vigil_uptime_seconds %s' % (time.time() - self.started))
+        return '\n'.join(lines) + '\n'
+
+
+class VigilCache(object):  # LRU cache with TTL, keyed by (chat, user), concurrent misses of one key share one load
+    def __init__(self, fetch, max_size: int, ttl: timedelta, negative_ttl: timedelta):
+        self.fetch = fetch  # Coroutine function (group_id, user_id) -> types.ChatMember
+        self.max_size: int = max_size
+        self.ttl: timedelta = ttl
+        self.negative_ttl: timedelta = negative_ttl
+        self.entries: OrderedDict = OrderedDict()  # (group_id, user_id) -> (value, expire_time)
+        self.pending: dict = dict()  # (group_id, user_id) -> asyncio.Task
+        self.hits: int = 0
+        self.misses: int = 0
+        self.evictions: int = 0
+        self.coalesced: int = 0
+
+    def peek(self, group_id: int, user_id: int):
+        entry: tuple or None = self.entries.get((group_id, user_id), None)
+        return entry[0] if entry else None
+
+    def put(self, group_id: int, user_id: int, value, negative: bool = False):
+        key: tuple = (group_id, user_id)
+        self.entries[key] = (value, VigilClock.utcnow() + (self.negative_ttl if negative else self.ttl))
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, group_id: int, user_id: int):
+        self.entries.pop((group_id, user_id), None)
+
+    async def load(self, group_id: int, user_id: int):
+        raise NotImplementedError
+
+    async def get(self, group_id: int, user_id: int):
+        key: tuple = (group_id, user_id)
+        entry: tuple or None = self.entries.get(key, None)
+        if entry and (entry[1] > VigilClock.utcnow()):
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+        self.misses += 1
+        task: asyncio.Task or None = self.pending.get(key, None)
+        if task:
+            self.coalesced += 1
+        else:
+            task = asyncio.ensure_future(self.load(group_id, user_id))
+            self.pending[key] = task
+            task.add_done_callback(lambda _: self.pending.pop(key, None))
+        return await asyncio.shield(task)
+
+    def get_stats(self) -> dict:
+        return {
+            'size': len(self.entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'coalesced': self.coalesced,
+            'hit_ratio': self.hits / max(self.hits + self.misses, 1)
+        }
+
+
+class VigilMemberCache(VigilCache):  # Names of chat members
+    def __init__(
+            self, fetch,
+            max_size: int = 10000,
+            ttl: timedelta = timedelta(hours=12),
+            negative_ttl: timedelta = timedelta(minutes=10)
+    ):
+        super().__init__(fetch, max_size, ttl, negative_ttl)
+        self.on_change = None  # Called with (group_id, user_id) when a cached name is replaced by a different one
+
+    def put(self, group_id: int, user_id: int, value: VigilChatMember, negative: bool = False):
+        previous: VigilChatMember or None = self.peek(group_id, user_id)
+        super().put(group_id, user_id, value, negative)
+        if self.on_change and previous and (previous.name != value.name):
+            self.on_change(group_id, user_id)
+
+    async def load(self, group_id: int, user_id: int) -> VigilChatMember:
+        logger.info('No valid user information cache found for user "%s", fetching...' % user_id)
+        try:
+            chat_member: types.ChatMember = await self.fetch(group_id, user_id)
+        except utils.exceptions.BadRequest:
+            member: VigilChatMember = VigilChatMember()
+            self.put(group_id, user_id, member, negative=True)
+            return member
+        member: VigilChatMember = VigilChatMember(chat_member.user)
+        self.put(group_id, user_id, member)
+        return member
+
+
+class VigilPermissionCache(VigilCache):  # Whether a user is an administrator of a chat
+    ADMIN_STATUSES: tuple = ('creator', 'administrator')
+
+    def __init__(
+            self, fetch,
+            max_size: int = 10000,
+            ttl: timedelta = timedelta(minutes=5),
+            negative_ttl: timedelta = timedelta(minutes=1)
+    ):
+        super().__init__(fetch, max_size, ttl, negative_ttl)
+
+    def update(self, group_id: int, member: types.ChatMember):
+        self.put(group_id, member.user.id, member.status in self.ADMIN_STATUSES)
+
+    async def load(self, group_id: int, user_id: int) -> bool:
+        try:
+            chat_member: types.ChatMember = await self.fetch(group_id, user_id)
+        except utils.exceptions.BadRequest:
+            self.put(group_id, user_id, False, negative=True)
+            return False
+        self.update(group_id, chat_member)
+        return chat_member.status in self.ADMIN_STATUSES
+
+
+class VigilGroup(VigilModel):
     yaml_tag: str = '!VigilGroup'
 
+    SETTINGS: tuple = (  # Plain settings, persisted as a whole by VigilBot.update_group()
+        'enabled', 'master', 'slave_of', 'timezone', 'title_enabled', 'title_template', 'deadline',
+        'start_time', 'stop_time', 'delay_winner_broadcast', 'broadcast_status', 'broadcast_winner'
+    )
+    TRANSIENT: tuple = (  # Runtime only, never serialized
+        'observer', 'timezone_index', 'auto_join_index', 'offset_index'
+    )
+    __slots__: tuple = ('id', 'mode', 'auto_join', 'hall', 'winners', 'stats') + SETTINGS + TRANSIENT
+
     def __init__(
             self, group_id: int,
             enabled: bool = False,
@@ -175,109 +838,280 @@ class VigilGroup(yaml.YAMLObject):
         self.stop_time: int = stop_time
         self.delay_winner_broadcast: bool = delay_winner_broadcast
         self.winners: dict = dict()
+        self.stats: VigilStats = VigilStats()
         self.broadcast_status: bool = broadcast_status
         self.broadcast_winner: bool = broadcast_winner
-
-    def check_integrity(self):
-        default_values = {  # Default values
-            'enabled': False,
-            'master': True,
-            'slave_of': '0',
-            'timezone': 'Asia/Shanghai',
-            'title_enabled': False,
-            'title_template': '椰树 {yeshu_year} 年第 {day} 届守夜大赛',
-            'auto_join': dict(),
-            'hall': dict(),
-            'mode': VigilMode(VigilMode.LAST),
-            'deadline': 6,
-            'start_time': 0,
-            'stop_time': 9,
-            'delay_winner_broadcast': False,
-            'winners': dict(),
-            'broadcast_status': False,
-            'broadcast_winner': True
-        }
-        if 'id' not in self.__dict__.keys():
+        self.observer = None  # Called with every mutation of hall, auto_join and winners
+        self.timezone_index: dict or None = None  # Timezone -> IDs of users in hall, built on demand
+        self.auto_join_index: dict or None = None  # Timezone -> IDs of users in auto_join, built on demand
+        self.offset_index: tuple or None = None  # (valid from, valid until, offsets, renders), dropped by hall changes
+
+    def to_dict(self) -> dict:
+        record: dict = self.get_settings()
+        record.update({
+            'version': self.VERSION,
+            'id': self.id,
+            'auto_join': [user.to_dict() for user in self.auto_join.values()],
+            'hall': [user.to_dict() for user in self.hall.values()],
+            'winners': {
+                date: {offset: winner.to_dict() for offset, winner in winners.items()}
+                for date, winners in self.winners.items()
+            },
+            'stats': self.stats.to_dict()
+        })
+        return record
+
+    @classmethod
+    def from_dict(cls, record: dict):
+        cls.check_version(record)
+        group: VigilGroup = cls(record['id'])
+        group.apply_settings(record)
+        for user_record in record['auto_join']:
+            user: VigilUser = VigilUser.from_dict(user_record)
+            group.auto_join[user.id] = user
+        for user_record in record['hall']:
+            user: VigilUser = VigilUser.from_dict(user_record)
+            group.hall[user.id] = user
+        for date, winners in record['winners'].items():
+            group.winners[date] = {offset: VigilWinner.from_dict(winner) for offset, winner in winners.items()}
+        group.stats = VigilStats.from_dict(record['stats'])
+        return group
+
+    @classmethod
+    def from_state(cls, state: dict):
+        if 'id' not in state.keys():
             raise ValueError('Corrupted group data: WTF is this group?')  # Manual correction needed
-        for key in default_values.keys():
-            if key not in self.__dict__.keys():
-                logger.warning('Key "%s" not found for group "%s", applying default value' % (key, self.id))
-                self.__dict__[key] = default_values[key]
+        group: VigilGroup = cls(state['id'])
+        for key in cls.__slots__:
+            if (key in cls.TRANSIENT) or (key == 'id'):
+                continue
+            if key in state.keys():
+                setattr(group, key, state[key])
+            elif key != 'stats':  # Defaults from the constructor
+                logger.warning('Key "%s" not found for group "%s", applying default value' % (key, group.id))
+        if 'stats' not in state.keys():  # Older data, only what is still in winners can be counted
+            group.stats = VigilStats.build(group.query_winners('', '~'))
+        return group
+
+    def notify(self, event: str, **kwargs):
+        if self.observer:
+            self.observer(self, event, **kwargs)
+
+    def get_settings(self) -> dict:
+        settings: dict = {key: getattr(self, key) for key in self.SETTINGS}
+        settings['mode'] = self.mode.mode
+        return settings
+
+    def apply_settings(self, settings: dict):
+        for key in self.SETTINGS:
+            if key in settings.keys():
+                setattr(self, key, settings[key])
+        if 'mode' in settings.keys():
+            self.mode = VigilMode(settings['mode'])
+
+    def is_dormant(self) -> bool:  # Nothing scheduled or pending, no need to load it before it is accessed
+        return self.master and (not self.enabled) and (not self.title_enabled) and \
+            (not self.hall) and (not self.auto_join)
 
     def get_user(self, user_id) -> VigilUser or None:
         return self.hall.get(user_id, None)
 
+    @staticmethod
+    def build_index(users: dict) -> dict:
+        index: dict = dict()
+        for user in users.values():
+            VigilGroup.add_to_index(index, user)
+        return index
+
+    @staticmethod
+    def add_to_index(index: dict or None, user: VigilUser):
+        if index is None:
+            return
+        if user.timezone not in index.keys():
+            index[user.timezone]: dict = dict()  # Used as an ordered set
+        index[user.timezone][user.id] = None
+
+    @staticmethod
+    def remove_from_index(index: dict or None, user: VigilUser):
+        if index is None:
+            return
+        user_ids: dict or None = index.get(user.timezone, None)
+        if user_ids is None:
+            return
+        user_ids.pop(user.id, None)
+        if not user_ids:
+            del index[user.timezone]
+
+    def get_timezone_index(self) -> dict:
+        if self.timezone_index is None:
+            self.timezone_index = self.build_index(self.hall)
+        return self.timezone_index
+
+    def get_auto_join_index(self) -> dict:
+        if self.auto_join_index is None:
+            self.auto_join_index = self.build_index(self.auto_join)
+        return self.auto_join_index
+
+    def index_user(self, user: VigilUser):
+        self.add_to_index(self.timezone_index, user)
+
+    def unindex_user(self, user: VigilUser):
+        self.remove_from_index(self.timezone_index, user)
+
+    def reset_index(self):  # Needed after hall or auto_join have been modified directly, e.g. by a storage backend
+        self.timezone_index = None
+        self.auto_join_index = None
+        self.offset_index = None
+
     def update_hall(self, user: VigilUser):
         logger.info('Information of user with ID "%s" updated' % user.id)
+        previous: VigilUser or None = self.hall.get(user.id, None)
+        if previous:
+            self.unindex_user(previous)
         self.hall[user.id] = user
+        self.index_user(user)
+        self.offset_index = None
+        self.notify('hall', user=user)
+
+    def update_activity(self, user: VigilUser, time: datetime):
+        user.update_activity(time)
+        self.notify('active', user=user, time=time)
+
+    def remove_user(self, user_id: int) -> VigilUser or None:
+        user: VigilUser or None = self.hall.pop(user_id, None)
+        if user:
+            self.unindex_user(user)
+            self.offset_index = None
+            self.notify('remove', user_id=user_id)
+        return user
+
+    def update_auto_join(self, user: VigilUser):
+        previous: VigilUser or None = self.auto_join.get(user.id, None)
+        self.auto_join[user.id] = user
+        if previous and (previous.timezone != user.timezone):  # Rebuilt, users stay in the order of auto_join
+            self.auto_join_index = None
+        self.add_to_index(self.auto_join_index, user)
+        self.notify('auto_join', user=user)
+
+    def remove_auto_join(self, user_id: int) -> VigilUser or None:
+        user: VigilUser or None = self.auto_join.pop(user_id, None)
+        if user:
+            self.remove_from_index(self.auto_join_index, user)
+            self.notify('remove_auto_join', user_id=user_id)
+        return user
+
+    def enroll(self, users: list):  # Bulk update_hall, persisted as a single event
+        for user in users:
+            previous: VigilUser or None = self.hall.get(user.id, None)
+            if previous and (previous.timezone == user.timezone):  # Keeps its place, same as a rebuilt index
+                self.hall[user.id] = user
+                continue
+            if previous:
+                self.unindex_user(previous)
+            self.hall[user.id] = user
+            self.index_user(user)
+        if users:
+            self.offset_index = None
+            logger.info('%s users enrolled in group "%s"' % (len(users), self.id))
+            self.notify('enroll', users=users)
 
     def update_winner(self, date: str, offset: str, winner: VigilWinner):
         logger.info('Information of winner with ID "%s" updated' % winner.id)
+        self.put_winner(date, offset, winner)
+        self.notify('winner', date=date, offset=offset, winner=winner)
+
+    def put_winner(self, date: str, offset: str, winner: VigilWinner):
         if not self.winners.get(date, None):
             self.winners[date]: dict = dict()
+        if not self.winners[date].get(offset, None):  # Otherwise only the broadcast status changed
+            self.stats.add_winner(date, offset, winner)
         self.winners[date][offset] = winner
 
-    def search_winner_record(self, timezone: str, date: str) -> VigilUser or None:
-        if type(self.winners[date]) != dict:
+    def rebuild_stats(self, records: list):
+        self.stats = VigilStats.build(records)
+        self.notify('stats', stats=self.stats)
+
+    def search_winner_record(self, timezone: str, date: str) -> VigilWinner or None:
+        if type(self.winners.get(date, None)) != dict:
             return None
         winner: VigilWinner or None = self.winners[date].get(timezone, None)
         return winner
 
-    @staticmethod
-    def find_user_with_timezone(user_dict, timezone) -> list:
+    def query_winners(self, start: str, end: str) -> list:  # Inclusive range of '%Y/%m/%d' dates
+        result: list = list()
+        for date in sorted(self.winners.keys()):
+            if (date < start) or (date > end):
+                continue
+            for offset, winner in sorted(self.winners[date].items()):
+                if winner:
+                    result.append((date, offset, winner))
+        return result
+
+    def expire_winners(self, before: str) -> list:  # Removes the winners of every date before the given one
+        dates: list = sorted(date for date in self.winners.keys() if date < before)
+        if not dates:
+            return list()
         result: list = list()
-        for user in user_dict.values():
-            if user.timezone == timezone:
-                result.append(user)
+        for date in dates:
+            for offset, winner in sorted(self.winners.pop(date).items()):
+                if winner:
+                    result.append((date, offset, winner))
+        self.notify('expire', dates=dates)
         return result
 
+    def find_hall_user_with_timezone(self, timezone) -> list:
+        return [self.hall[user_id] for user_id in self.get_timezone_index().get(timezone, dict()).keys()]
+
     def clean_up_hall(self, timezone):
-        remove_list: list = self.find_user_with_timezone(self.hall, timezone)
-        for user_id in remove_list:
-            try:
-                del self.hall[user_id]
-            except KeyError:
-                pass
-
-    def apply_auto_join(self):
-        utc_now: datetime = datetime.utcnow()
-        for timezone in pytz.all_timezones:
-            user_list: list = self.find_user_with_timezone(self.auto_join, timezone)
-            if len(user_list) < 1:
+        for user in self.find_hall_user_with_timezone(timezone):
+            self.remove_user(user.id)
+
+    def get_auto_join_time(self) -> tuple:  # Local (hour, minute) at which auto_join users enter hall
+        if self.mode.mode == VigilMode.NO_ACTIVITY:
+            return self.stop_time, 0
+        return self.deadline, 30
+
+    def apply_auto_join(self, utc_now: datetime or None = None):
+        utc_now: datetime = utc_now or VigilClock.utcnow()
+        enrolled: list = list()
+        for timezone, user_ids in sorted(self.get_auto_join_index().items()):  # Same order as pytz.all_timezones
+            localized_time: datetime = VigilTime.get_local_time(timezone, utc_now)
+            if (localized_time.hour, localized_time.minute) != self.get_auto_join_time():
                 continue
-            localized_time: datetime = pytz.utc.localize(utc_now, is_dst=None).astimezone(pytz.timezone(timezone))
-            if self.mode.mode == VigilMode.LAST:
-                if localized_time.hour != self.deadline:
-                    continue
-                elif localized_time.minute != 30:
-                    continue
-            if self.mode.mode == VigilMode.NO_ACTIVITY:
-                if localized_time.hour != self.stop_time:
-                    continue
-                elif localized_time.minute not in range(1):
-                    continue
-            for user in user_list:
-                user.active_time = list()
-                user.active_time.append(datetime.utcnow())
-                if user.id not in self.hall.keys():
-                    self.hall[user.id] = user
-
-    def i_dont_know_how_to_name_this_method(self) -> dict:
+            for user_id in user_ids.keys():
+                user: VigilUser = self.auto_join[user_id]
+                user.reset_activity(utc_now)
+                enrolled.append(user)  # Also when already in hall, the reset activity is persisted the same way
+        self.enroll(enrolled)
+
+    def get_offset_index(self, utc_now: datetime) -> tuple:  # Valid until hall changes or a DST transition
+        if self.offset_index and (self.offset_index[0] <= utc_now < self.offset_index[1]):
+            return self.offset_index
         result: dict = dict()
-        utc_now: datetime = datetime.utcnow()
-        for timezone in pytz.all_timezones:
-            user_list: list = self.find_user_with_timezone(self.hall, timezone)
-            if len(user_list) < 1:
-                continue
-            tz: pytz.timezone = pytz.timezone(timezone)
-            offset = pytz.utc.localize(utc_now, is_dst=None).astimezone(tz).strftime('%z')
+        (valid_from, valid_until) = (datetime.min, datetime.max)
+        for timezone in sorted(self.get_timezone_index().keys()):  # Same order as pytz.all_timezones
+            user_list: list = self.find_hall_user_with_timezone(timezone)
+            entry: tuple = VigilTime.get_entry(timezone, utc_now)
+            (valid_from, valid_until) = (max(valid_from, entry[0]), min(valid_until, entry[1]))
+            offset: str = entry[3]
             if offset not in result.keys():
                 result[offset] = (list(), list())
             (timezones, users) = result[offset]
             timezones.append(timezone)
             users = users + user_list
             result[offset] = (timezones, users)
-        return result
+        self.offset_index = (valid_from, valid_until, result, dict())
+        return self.offset_index
+
+    def i_dont_know_how_to_name_this_method(self, utc_now: datetime or None = None) -> dict:  # Shared, read only
+        return self.get_offset_index(utc_now or VigilClock.utcnow())[2]
+
+    def get_renders(self, utc_now: datetime or None = None) -> dict:  # Texts rendered from hall, dropped along with it
+        return self.get_offset_index(utc_now or VigilClock.utcnow())[3]
+
+    def clear_renders(self):  # Names shown in them have changed, replaced so that renders in flight are not kept
+        if self.offset_index:
+            self.offset_index = self.offset_index[:3] + (dict(),)
 
     @staticmethod
     def find_latest_user(users) -> VigilUser or None:
@@ -285,32 +1119,94 @@ class VigilGroup(yaml.YAMLObject):
             return None
         last_user: VigilUser = VigilUser(0, datetime(1970, 1, 1), is_dummy=True)  # Dummy user
         for user in users:
-            if user.active_time[len(user.active_time) - 1] > \
-                    last_user.active_time[len(last_user.active_time) - 1]:
+            if user.last_active > last_user.last_active:
                 last_user = user
         return last_user
 
-    def find_winner(self):
+    def is_match_started(self, hour: int) -> bool:
+        if self.start_time > self.stop_time:
+            return (hour >= self.start_time) or (hour < self.stop_time)
+        else:
+            return (hour >= self.start_time) and (hour < self.stop_time)
+
+    @staticmethod
+    def next_local_time(timezone: str, hour: int, minute: int, utc_now: datetime) -> datetime or None:
+        local_now: datetime = VigilTime.get_local_time(timezone, utc_now)
+        for days in range(3):
+            day: datetime = local_now + timedelta(days=days)
+            naive: datetime = datetime(day.year, day.month, day.day, hour, minute)
+            (valid_from, valid_until, offset, _) = VigilTime.get_entry(timezone, naive - (local_now - utc_now))
+            candidates: list = [naive - offset]
+            if candidates[0] - timedelta(days=1) < valid_from:  # Near a transition, the previous offset may apply
+                candidates.append(naive - VigilTime.get_offset(timezone, valid_from - timedelta(microseconds=1)))
+            if candidates[0] + timedelta(days=1) >= valid_until:
+                candidates.append(naive - VigilTime.get_offset(timezone, valid_until))
+            valid: list = [time for time in candidates if time + VigilTime.get_offset(timezone, time) == naive]
+            if not valid:  # Skipped by a DST transition
+                continue
+            utc_time: datetime = valid[0]
+            if len(set(valid)) > 1:  # Ambiguous, the one in DST as pytz defines it
+                localized_time: datetime = pytz.timezone(timezone).localize(naive, is_dst=True)
+                utc_time = localized_time.astimezone(pytz.utc).replace(tzinfo=None)
+            if utc_time > utc_now:
+                return utc_time
+        return None
+
+    def has_last_survivor(self, utc_now: datetime) -> bool:
+        for offset, (timezones, users) in self.i_dont_know_how_to_name_this_method(utc_now).items():
+            localized_time: datetime = VigilTime.get_local_time(timezones[0], utc_now)
+            if localized_time.hour > ((self.stop_time + 1) % 24):
+                continue
+            if self.is_match_started(localized_time.hour) and (len(users) == 1):
+                return True
+        return False
+
+    def next_decision_time(self, utc_now: datetime) -> datetime or None:
+        if (not self.enabled) or (not self.master):
+            return None
+        if self.has_last_survivor(utc_now):  # Decided on the next minute, just like with the old per-minute check
+            return utc_now.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        local_times: list = [
+            (self.start_time, 0),  # Match starts
+            ((24 + self.start_time - 1) % 24, 0),  # One hour before start
+            (self.stop_time, 0)  # Match stops, delayed winners are announced
+        ]
+        if (self.mode.mode == VigilMode.LAST) and (self.deadline in range(24)):
+            local_times += [(self.deadline, 0), (self.deadline, 30)]  # Winner is decided, auto join is applied
+        if self.mode.mode == VigilMode.NO_ACTIVITY:
+            local_times.append(((self.start_time + 1) % 24, 0))  # Inactive users are eliminated from now on
+        timezones: set = set(self.get_timezone_index().keys())
+        timezones.update(self.get_auto_join_index().keys())
+        for date in (utc_now - timedelta(days=1), utc_now):
+            for winner in self.winners.get(date.strftime('%Y/%m/%d'), dict()).values():
+                if winner and (not winner.broadcasted):
+                    timezones.add(winner.timezones[0])
+        candidates: list = list()
+        for timezone in timezones:
+            for (hour, minute) in local_times:
+                candidates.append(self.next_local_time(timezone, hour, minute, utc_now))
+        if (self.mode.mode == VigilMode.NO_ACTIVITY) and self.hall:
+            earliest: datetime = min(user.last_active for user in self.hall.values())
+            candidates.append(earliest + timedelta(minutes=self.deadline, seconds=1))
+        candidates = [candidate for candidate in candidates if candidate and (candidate > utc_now)]
+        if not candidates:
+            return None
+        return min(candidates)
+
+    def find_winner(self, utc_time: datetime or None = None):
         if (not self.enabled) or (not self.master):
             return
-        utc_time: datetime = datetime.utcnow()
+        utc_time: datetime = utc_time or VigilClock.utcnow()
         day_string: str = utc_time.strftime('%Y/%m/%d')
-        users_in_matches: dict = self.i_dont_know_how_to_name_this_method()
+        users_in_matches: dict = self.i_dont_know_how_to_name_this_method(utc_time)
         for offset, (timezones, users) in users_in_matches.items():
-            tz: pytz.timezone = pytz.timezone(timezones[0])
-            localized_time: datetime = pytz.utc.localize(utc_time, is_dst=None).astimezone(tz)
+            localized_time: datetime = VigilTime.get_local_time(timezones[0], utc_time)
             if localized_time.hour > ((self.stop_time + 1) % 24):
                 continue
-            match_started: bool = False
-            if self.start_time > self.stop_time:
-                if (localized_time.hour >= self.start_time) or (localized_time.hour < self.stop_time):
-                    match_started = True
-            else:
-                if (localized_time.hour >= self.start_time) and (localized_time.hour < self.stop_time):
-                    match_started = True
+            match_started: bool = self.is_match_started(localized_time.hour)
             if match_started and (len(users) == 1):
                 self.update_winner(day_string, offset, VigilWinner(users[0], timezones))
-                del self.hall[users[0].id]
+                self.remove_user(users[0].id)
             if self.mode.mode == VigilMode.LAST:
                 if self.deadline not in range(24):
                     continue
@@ -325,43 +1221,853 @@ class VigilGroup(yaml.YAMLObject):
                 if match_started and (localized_time.hour >= ((self.start_time + 1) % 24)):
                     remove_list: list = list()
                     for user in users:
-                        if user.active_time[len(user.active_time) - 1] + timedelta(minutes=self.deadline) < utc_time:
+                        if user.last_active + timedelta(minutes=self.deadline) < utc_time:
                             remove_list.append(user)
                     if (len(users) - len(remove_list) == 0) and (len(remove_list) > 0):
                         winner: VigilUser or None = self.find_latest_user(remove_list)
                         if winner:
                             self.update_winner(day_string, offset, VigilWinner(winner, timezones))
                     for user in remove_list:
-                        try:
-                            del self.hall[user.id]
-                        except KeyError:
-                            continue
-        self.apply_auto_join()
+                        self.remove_user(user.id)
+        self.apply_auto_join(utc_time)
+
+
+class VigilResolver(object):  # Decides the matches of many groups at once, optionally vectorized over all participants
+    MICROSECOND: timedelta = timedelta(microseconds=1)  # Times are packed as integer microseconds since the epoch
+
+    def __init__(self, vectorized: bool = False):  # Packing the arrays costs more than it saves at benchmarked sizes
+        self.vectorized: bool = vectorized and (numpy is not None)
+
+    def resolve(self, groups: list, utc_time: datetime):
+        if not self.vectorized:
+            for group in groups:
+                group.find_winner(utc_time)  # Reference implementation
+            return
+        buckets: list = list()  # (group, offset, timezones, users, local time), one per offset of every group
+        bucket_ids: list = list()  # Bucket of every participant, participants of a bucket are contiguous
+        active: list = list()
+        cutoffs: list = list()  # Per bucket, participants not active since then are eliminated in NO_ACTIVITY mode
+        groups: list = [group for group in groups if group.enabled and group.master]
+        for group in groups:
+            for offset, (timezones, users) in group.i_dont_know_how_to_name_this_method(utc_time).items():
+                bucket_ids += [len(buckets)] * len(users)
+                active += [(user.last_active - VigilClock.EPOCH) // self.MICROSECOND for user in users]
+                cutoffs.append((utc_time - timedelta(minutes=group.deadline) - VigilClock.EPOCH) // self.MICROSECOND)
+                buckets.append((group, offset, timezones, users, VigilTime.get_local_time(timezones[0], utc_time)))
+        bucket_index: numpy.ndarray = numpy.array(bucket_ids, dtype=numpy.int64)
+        active_times: numpy.ndarray = numpy.array(active, dtype=numpy.int64)
+        counts: numpy.ndarray = numpy.bincount(bucket_index, minlength=len(buckets))
+        starts: numpy.ndarray = numpy.cumsum(counts) - counts
+        eliminated: numpy.ndarray = active_times < numpy.array(cutoffs, dtype=numpy.int64)[bucket_index]
+        eliminated_counts: numpy.ndarray = numpy.bincount(bucket_index, weights=eliminated, minlength=len(buckets))
+        order: numpy.ndarray = numpy.lexsort((  # By bucket, latest activity first, earlier participant on ties
+            numpy.arange(len(active)), -active_times, bucket_index
+        ))
+        latest: numpy.ndarray = order[starts[counts > 0]] - starts[counts > 0]
+        latest_of_bucket: dict = dict(zip(numpy.flatnonzero(counts > 0).tolist(), latest.tolist()))
+        day_string: str = utc_time.strftime('%Y/%m/%d')
+        for bucket, (group, offset, timezones, users, localized_time) in enumerate(buckets):
+            if localized_time.hour > ((group.stop_time + 1) % 24):
+                continue
+            count: int = int(counts[bucket])
+            match_started: bool = group.is_match_started(localized_time.hour)
+            if match_started and (count == 1):
+                group.update_winner(day_string, offset, VigilWinner(users[0], timezones))
+                group.remove_user(users[0].id)
+            if count == 0:
+                continue
+            latest_user: VigilUser = users[latest_of_bucket[bucket]]
+            if group.mode.mode == VigilMode.LAST:
+                if (group.deadline in range(24)) and (localized_time.hour == group.deadline) and \
+                        (localized_time.minute == 0):
+                    group.update_winner(day_string, offset, VigilWinner(latest_user, timezones))
+                    for timezone in timezones:
+                        group.clean_up_hall(timezone)
+            if group.mode.mode == VigilMode.NO_ACTIVITY:
+                if match_started and (localized_time.hour >= ((group.start_time + 1) % 24)):
+                    start: int = int(starts[bucket])
+                    if eliminated_counts[bucket] == count:  # Nobody left, the last one to fall asleep wins
+                        group.update_winner(day_string, offset, VigilWinner(latest_user, timezones))
+                    for index in numpy.flatnonzero(eliminated[start:start + count]).tolist():
+                        group.remove_user(users[index].id)
+        for group in groups:
+            group.apply_auto_join(utc_time)
+
+
+class VigilGroupMap(dict):  # Groups by ID, the ones in "unloaded" are only read from storage when accessed
+    def __init__(self, loader=None, unloaded: set or None = None):
+        super().__init__()
+        self.loader = loader  # Group ID -> VigilGroup or None
+        self.on_load = None  # Called with every lazily loaded group
+        self.unloaded: set = unloaded or set()
+
+    def load(self, group_id: int) -> VigilGroup or None:
+        if (group_id not in self.unloaded) or (not self.loader):
+            return None
+        self.unloaded.discard(group_id)
+        group: VigilGroup or None = self.loader(group_id)
+        if group:
+            dict.__setitem__(self, group_id, group)
+            logger.info('Group with ID "%s" loaded on demand' % group_id)
+            if self.on_load:
+                self.on_load(group)
+        return group
+
+    def get(self, group_id: int, default=None) -> VigilGroup or None:
+        if dict.__contains__(self, group_id):
+            return dict.__getitem__(self, group_id)
+        group: VigilGroup or None = self.load(group_id)
+        return group if group else default
+
+    def __missing__(self, group_id: int) -> VigilGroup:
+        group: VigilGroup or None = self.load(group_id)
+        if not group:
+            raise KeyError(group_id)
+        return group
+
+    def __contains__(self, group_id: int) -> bool:
+        return dict.__contains__(self, group_id) or (group_id in self.unloaded)
+
+    def __delitem__(self, group_id: int):
+        self.unloaded.discard(group_id)
+        dict.pop(self, group_id, None)
+
+    def pop(self, group_id: int, default=None) -> VigilGroup or None:
+        self.unloaded.discard(group_id)
+        return dict.pop(self, group_id, default)
+
+
+class VigilStorage(object):  # Persistence backend interface used by VigilBot
+    name: str = ''
+    default_path: str = ''
+
+    def __init__(self, data_path: str or None = None):
+        self.data_path: str = data_path or self.default_path
+        self.pending: list = list()  # Buffered writes, taken on the event loop and written by write_pending
+
+    @staticmethod
+    def backend(name: str) -> type:
+        for storage in VigilStorage.__subclasses__():
+            if storage.name == name:
+                return storage
+        raise ValueError('Unknown storage backend "%s"' % name)
+
+    @staticmethod
+    def create(backend: str, data_path: str or None = None):
+        return VigilStorage.backend(backend)(data_path)
+
+    @classmethod
+    def exists(cls, data_path: str) -> bool:  # Checked before creating the backend, which may create the files
+        return os.path.exists(data_path)
+
+    def load(self) -> dict:
+        raise NotImplementedError
+
+    def save_group(self, group: VigilGroup):
+        raise NotImplementedError
+
+    def remove_group(self, group_id: int):
+        raise NotImplementedError
+
+    def add_admin(self, user_id: int):
+        raise NotImplementedError
+
+    def set_checkpoint(self, time: datetime):  # Every decision point up to then has been handled
+        raise NotImplementedError
+
+    def record_group_event(self, group: VigilGroup, event: str, **kwargs):
+        raise NotImplementedError
+
+    @property
+    def dirty(self) -> bool:
+        return len(self.pending) > 0
+
+    def take_pending(self) -> list:
+        pending: list = self.pending
+        self.pending = list()
+        return pending
+
+    def write_pending(self, pending: list) -> int:  # May run in a worker thread, must not touch the live data
+        raise NotImplementedError  # Returns the number of bytes written
+
+    def import_data(self, data: dict):  # Blocking, writes everything as regular mutations, e.g. to move groups
+        for user_id in data['admins']:
+            self.add_admin(user_id)
+        for group in data['groups'].values():
+            self.save_group(group)
+            for user in group.auto_join.values():
+                self.record_group_event(group, 'auto_join', user=user)
+            for user in group.hall.values():
+                self.record_group_event(group, 'hall', user=user)
+            for (date, offset, winner) in group.query_winners('', '~'):
+                self.record_group_event(group, 'winner', date=date, offset=offset, winner=winner)
+            self.record_group_event(group, 'stats', stats=group.stats)
+        self.flush()
+
+    def flush(self):
+        self.write_pending(self.take_pending())
+
+    def need_compaction(self) -> bool:
+        return False
+
+    def snapshot(self, data: dict) -> dict or None:
+        return None
+
+    def compact(self, snapshot: dict or None):
+        pass
+
+
+class VigilJournal(VigilStorage):  # Append-only mutation log (one ujson record per line) on top of a YAML snapshot
+    name: str = 'journal'
+    default_path: str = 'data.yaml'
+
+    def __init__(self, data_path: str or None = None, compact_threshold: int = 10000):
+        super().__init__(data_path)
+        self.journal_path: str = self.data_path + '.journal'
+        self.compact_threshold: int = compact_threshold
+        self.records: int = 0
+        self.file = None
+
+    @classmethod
+    def exists(cls, data_path: str) -> bool:
+        return os.path.exists(data_path) or os.path.exists(data_path + '.journal')
+
+    def load(self) -> dict:
+        data: dict = dict()
+        if os.path.isfile(self.data_path):
+            with open(self.data_path) as f:
+                data = yaml.safe_load(f) or dict()
+                logger.info('Snapshot loaded from "%s"' % self.data_path)
+        if 'groups' not in data.keys():
+            data['groups']: dict = dict()
+        for group_id, group in data['groups'].items():
+            if isinstance(group, dict):  # Snapshots written since the versioned records, older ones are tagged
+                data['groups'][group_id] = VigilGroup.from_dict(group)
+        if 'admins' not in data.keys():
+            data['admins']: list = list()
+        data['checkpoint'] = VigilClock.from_epoch(data['checkpoint']) if data.get('checkpoint', None) else None
+        self.replay(data)
+        return data
+
+    def save_group(self, group: VigilGroup):
+        self.append({'op': 'settings', 'group': group.id, 'settings': group.get_settings()})
+
+    def remove_group(self, group_id: int):
+        self.append({'op': 'remove_group', 'group': group_id})
+
+    def add_admin(self, user_id: int):
+        self.append({'op': 'admin', 'id': user_id})
+
+    def set_checkpoint(self, time: datetime):
+        self.append({'op': 'checkpoint', 'time': VigilClock.to_epoch(time)})
+
+    def replay(self, data: dict):
+        if not os.path.isfile(self.journal_path):
+            return
+        with open(self.journal_path) as f:
+            for line in f:
+                try:
+                    record: dict = ujson.loads(line)
+                except ValueError:
+                    logger.warning('Truncated record found in "%s", ignoring the rest' % self.journal_path)
+                    break
+                self.apply(data, record)
+                self.records += 1
+        logger.info('%s records replayed from "%s"' % (self.records, self.journal_path))
+
+    def apply(self, data: dict, record: dict):
+        op: str = record['op']
+        if op == 'admin':
+            if record['id'] not in data['admins']:
+                data['admins'].append(record['id'])
+            return
+        if op == 'checkpoint':
+            data['checkpoint'] = VigilClock.from_epoch(record['time'])
+            return
+        if op == 'remove_group':
+            data['groups'].pop(record['group'], None)
+            return
+        group: VigilGroup or None = data['groups'].get(record['group'], None)
+        if op == 'settings':
+            if not group:
+                group = VigilGroup(record['group'])
+                data['groups'][group.id] = group
+            group.apply_settings(record['settings'])
+            return
+        if not group:
+            return
+        if op == 'hall':
+            user: VigilUser = VigilUser.from_dict(record['user'])
+            group.hall[user.id] = user
+        elif op == 'enroll':
+            for user_record in record['users']:
+                user: VigilUser = VigilUser.from_dict(user_record)
+                group.hall[user.id] = user
+        elif op == 'active':
+            user: VigilUser or None = group.hall.get(record['user'], None)
+            if user:
+                user.update_activity(VigilClock.from_epoch(record['time']))
+        elif op == 'remove':
+            group.hall.pop(record['user'], None)
+        elif op == 'auto_join':
+            user: VigilUser = VigilUser.from_dict(record['user'])
+            group.auto_join[user.id] = user
+        elif op == 'remove_auto_join':
+            group.auto_join.pop(record['user'], None)
+        elif op == 'winner':
+            group.put_winner(record['date'], record['offset'], VigilWinner.from_dict(record['winner']))
+        elif op == 'expire':
+            for date in record['dates']:
+                group.winners.pop(date, None)
+        elif op == 'stats':
+            group.stats = VigilStats.from_dict(record['stats'])
+        else:
+            logger.warning('Unknown journal record "%s"' % op)
+
+    def append(self, record: dict):
+        self.pending.append(ujson.dumps(record, ensure_ascii=False) + '\n')
+        self.records += 1
+
+    def write_pending(self, pending: list) -> int:
+        if not pending:
+            return 0
+        if not self.file:
+            self.file = open(self.journal_path, 'ab')
+        content: bytes = ''.join(pending).encode()
+        self.file.write(content)
+        self.file.flush()
+        return len(content)
+
+    def record_group_event(self, group: VigilGroup, event: str, **kwargs):
+        record: dict = {'op': event, 'group': group.id}
+        if event in ('hall', 'auto_join'):
+            record['user'] = kwargs['user'].to_dict()
+        elif event == 'enroll':
+            record['users'] = [user.to_dict() for user in kwargs['users']]
+        elif event == 'active':
+            record['user'] = kwargs['user'].id
+            record['time'] = VigilClock.to_epoch(kwargs['time'])
+        elif event in ('remove', 'remove_auto_join'):
+            record['user'] = kwargs['user_id']
+        elif event == 'winner':
+            record['date'] = kwargs['date']
+            record['offset'] = kwargs['offset']
+            record['winner'] = kwargs['winner'].to_dict()
+        elif event == 'expire':
+            record['dates'] = kwargs['dates']
+        elif event == 'stats':
+            record['stats'] = kwargs['stats'].to_dict()
+        self.append(record)
+
+    def need_compaction(self) -> bool:
+        return self.records >= self.compact_threshold
+
+    def snapshot(self, data: dict) -> dict or None:  # Plain records, safe to hand over to a worker thread
+        self.pending = list()  # Everything buffered so far is part of the snapshot
+        self.records = 0
+        return {
+            'admins': list(data['admins']),
+            'checkpoint': VigilClock.to_epoch(data['checkpoint']) if data.get('checkpoint', None) else None,
+            'groups': {group_id: group.to_dict() for group_id, group in data['groups'].items()}
+        }
+
+    def compact(self, snapshot: dict or None):
+        temp_path: str = self.data_path + '.tmp'
+        with open(temp_path, 'w') as f:
+            yaml.dump(snapshot, f, Dumper=YAML_DUMPER)
+        os.replace(temp_path, self.data_path)
+        if self.file:
+            self.file.close()
+        self.file = open(self.journal_path, 'wb')
+        logger.info('Snapshot written to "%s", journal truncated' % self.data_path)
+
+
+class VigilSQLiteStorage(VigilStorage):  # One row per group, participant and winner, written in batched transactions
+    name: str = 'sqlite'
+    default_path: str = 'data.db'
+    SCHEMA: tuple = (
+        'CREATE TABLE IF NOT EXISTS groups (id INTEGER PRIMARY KEY, settings TEXT NOT NULL)',
+        'CREATE TABLE IF NOT EXISTS hall ('
+        'group_id INTEGER, user_id INTEGER, timezone TEXT, joined INTEGER, is_dummy INTEGER, active REAL, '
+        'messages INTEGER, recent BLOB, PRIMARY KEY (group_id, user_id))',
+        'CREATE TABLE IF NOT EXISTS auto_join ('
+        'group_id INTEGER, user_id INTEGER, timezone TEXT, joined INTEGER, is_dummy INTEGER, active REAL, '
+        'messages INTEGER, recent BLOB, PRIMARY KEY (group_id, user_id))',
+        'CREATE TABLE IF NOT EXISTS winners ('
+        'group_id INTEGER, date TEXT, offset TEXT, user_id INTEGER, last_online REAL, timezones TEXT, '
+        'broadcasted INTEGER, PRIMARY KEY (group_id, date, offset))',
+        'CREATE TABLE IF NOT EXISTS admins (id INTEGER PRIMARY KEY)',
+        'CREATE TABLE IF NOT EXISTS stats (group_id INTEGER PRIMARY KEY, stats TEXT NOT NULL)',
+        'CREATE TABLE IF NOT EXISTS checkpoint (id INTEGER PRIMARY KEY, time REAL NOT NULL)'
+    )
+
+    def __init__(self, data_path: str or None = None):
+        super().__init__(data_path)
+        self.connection: sqlite3.Connection = sqlite3.connect(self.data_path, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        for statement in self.SCHEMA:
+            self.connection.execute(statement)
+        self.connection.commit()
+
+    def execute(self, statement: str, parameters: tuple or list = ()):  # A list of parameter tuples, executemany
+        self.pending.append((statement, parameters))
+
+    @classmethod
+    def row_to_user(cls, row: tuple) -> VigilUser:
+        (user_id, timezone, joined, is_dummy, active, messages, recent) = row
+        user: VigilUser = VigilUser(
+            user_id, VigilClock.from_epoch(active), joined=bool(joined), timezone=timezone, is_dummy=bool(is_dummy)
+        )
+        if recent:
+            user.message_count = messages
+            user.recent_activity = array('q', recent)
+        return user
+
+    def load(self) -> dict:
+        data: dict = {'groups': VigilGroupMap(self.load_group), 'admins': list(), 'checkpoint': None}
+        occupied: set = {group_id for (group_id,) in self.connection.execute(
+            'SELECT group_id FROM hall UNION SELECT group_id FROM auto_join'
+        ).fetchall()}
+        for (group_id, settings) in self.connection.execute('SELECT id, settings FROM groups').fetchall():
+            if group_id not in occupied:
+                group: VigilGroup = VigilGroup(group_id)
+                group.apply_settings(ujson.loads(settings))
+                if group.is_dormant():
+                    data['groups'].unloaded.add(group_id)
+                    continue
+            data['groups'][group_id] = self.load_group(group_id)
+        for (user_id,) in self.connection.execute('SELECT id FROM admins').fetchall():
+            data['admins'].append(user_id)
+        row: tuple or None = self.connection.execute('SELECT time FROM checkpoint WHERE id = 0').fetchone()
+        if row:
+            data['checkpoint'] = VigilClock.from_epoch(row[0])
+        logger.info('%s groups loaded from "%s", %s left dormant' % (
+            len(data['groups']), self.data_path, len(data['groups'].unloaded)
+        ))
+        return data
+
+    def load_group(self, group_id: int) -> VigilGroup or None:
+        row: tuple or None = self.connection.execute(
+            'SELECT settings FROM groups WHERE id = ?', (group_id,)
+        ).fetchone()
+        if not row:
+            return None
+        group: VigilGroup = VigilGroup(group_id)
+        group.apply_settings(ujson.loads(row[0]))
+        for row in self.connection.execute(
+                'SELECT user_id, timezone, joined, is_dummy, active, messages, recent FROM hall WHERE group_id = ?',
+                (group_id,)
+        ):
+            user: VigilUser = self.row_to_user(row)
+            group.hall[user.id] = user
+        for row in self.connection.execute(
+                'SELECT user_id, timezone, joined, is_dummy, active, messages, recent FROM auto_join '
+                'WHERE group_id = ?', (group_id,)
+        ):
+            user: VigilUser = self.row_to_user(row)
+            group.auto_join[user.id] = user
+        for (date, offset, user_id, last_online, timezones, broadcasted) in self.connection.execute(
+                'SELECT date, offset, user_id, last_online, timezones, broadcasted FROM winners WHERE group_id = ?',
+                (group_id,)
+        ):
+            if date not in group.winners.keys():
+                group.winners[date] = dict()
+            group.winners[date][offset] = VigilWinner.create(
+                user_id, VigilClock.from_epoch(last_online), ujson.loads(timezones), bool(broadcasted)
+            )
+        row: tuple or None = self.connection.execute(
+            'SELECT stats FROM stats WHERE group_id = ?', (group_id,)
+        ).fetchone()
+        if row:
+            group.stats = VigilStats.from_dict(ujson.loads(row[0]))
+        else:  # Older database, only what is still in winners can be counted
+            group.stats = VigilStats.build(group.query_winners('', '~'))
+        return group
+
+    def save_group(self, group: VigilGroup):
+        self.execute(
+            'INSERT OR REPLACE INTO groups (id, settings) VALUES (?, ?)',
+            (group.id, ujson.dumps(group.get_settings(), ensure_ascii=False))
+        )
+
+    def remove_group(self, group_id: int):
+        for table in ('hall', 'auto_join', 'winners', 'stats'):
+            self.execute('DELETE FROM %s WHERE group_id = ?' % table, (group_id,))
+        self.execute('DELETE FROM groups WHERE id = ?', (group_id,))
+
+    def add_admin(self, user_id: int):
+        self.execute('INSERT OR IGNORE INTO admins (id) VALUES (?)', (user_id,))
+
+    def set_checkpoint(self, time: datetime):
+        self.execute('INSERT OR REPLACE INTO checkpoint (id, time) VALUES (0, ?)', (VigilClock.to_epoch(time),))
+
+    def record_group_event(self, group: VigilGroup, event: str, **kwargs):
+        if event in ('hall', 'auto_join', 'enroll'):
+            users: list = kwargs['users'] if event == 'enroll' else [kwargs['user']]
+            self.execute(
+                'INSERT OR REPLACE INTO %s (group_id, user_id, timezone, joined, is_dummy, active, messages, recent) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)' % ('hall' if event == 'enroll' else event),
+                [
+                    (
+                        group.id, user.id, user.timezone, user.joined, user.is_dummy,
+                        VigilClock.to_epoch(user.last_active), user.message_count, user.recent_activity.tobytes()
+                    ) for user in users
+                ]
+            )
+        elif event == 'active':
+            user: VigilUser = kwargs['user']
+            self.execute(
+                'UPDATE hall SET active = ?, messages = ?, recent = ? WHERE group_id = ? AND user_id = ?',
+                (
+                    VigilClock.to_epoch(kwargs['time']), user.message_count, user.recent_activity.tobytes(),
+                    group.id, user.id
+                )
+            )
+        elif event == 'remove':
+            self.execute('DELETE FROM hall WHERE group_id = ? AND user_id = ?', (group.id, kwargs['user_id']))
+        elif event == 'remove_auto_join':
+            self.execute('DELETE FROM auto_join WHERE group_id = ? AND user_id = ?', (group.id, kwargs['user_id']))
+        elif event == 'winner':
+            winner: VigilWinner = kwargs['winner']
+            self.execute(
+                'INSERT OR REPLACE INTO winners '
+                '(group_id, date, offset, user_id, last_online, timezones, broadcasted) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (
+                    group.id, kwargs['date'], kwargs['offset'], winner.id, VigilClock.to_epoch(winner.last_online),
+                    ujson.dumps(winner.timezones), winner.broadcasted
+                )
+            )
+        elif event == 'expire':
+            for date in kwargs['dates']:
+                self.execute('DELETE FROM winners WHERE group_id = ? AND date = ?', (group.id, date))
+        if event in ('winner', 'stats'):
+            self.execute(
+                'INSERT OR REPLACE INTO stats (group_id, stats) VALUES (?, ?)',
+                (group.id, ujson.dumps(group.stats.to_dict()))
+            )
+
+    def write_pending(self, pending: list) -> int:
+        if not pending:
+            return 0
+        size: int = 0
+        for (statement, parameters) in pending:
+            if isinstance(parameters, list):
+                self.connection.executemany(statement, parameters)
+                size += sum(self.parameters_size(row) for row in parameters)
+            else:
+                self.connection.execute(statement, parameters)
+                size += self.parameters_size(parameters)
+        self.connection.commit()
+        logger.info('%s changes committed to "%s"' % (len(pending), self.data_path))
+        return size
+
+    @staticmethod
+    def parameters_size(parameters: tuple) -> int:  # Bytes of the bound values, 8 per number as stored by SQLite
+        return sum(len(value.encode()) if isinstance(value, str) else 8 for value in parameters)
+
+    def compact(self, snapshot: dict or None):
+        self.flush()
+
+
+class VigilShardedStorage(VigilStorage):  # One YAML file per group plus an index, dormant groups are loaded lazily
+    name: str = 'sharded'
+    default_path: str = 'data'
+
+    def __init__(self, data_path: str or None = None):
+        super().__init__(data_path)
+        self.index_path: str = os.path.join(self.data_path, 'index.yaml')
+        self.groups_path: str = os.path.join(self.data_path, 'groups')
+        self.index: dict = {'admins': list(), 'groups': dict()}
+        self.changed: dict = dict()  # Group ID -> VigilGroup, or None when removed
+        self.index_changed: bool = False
+
+    def group_path(self, group_id: int) -> str:
+        return os.path.join(self.groups_path, '%s.yaml' % group_id)
+
+    @staticmethod
+    def write_file(path: str, content) -> int:
+        temp_path: str = path + '.tmp'
+        with open(temp_path, 'w') as f:
+            yaml.dump(content, f, Dumper=YAML_DUMPER)
+            size: int = f.tell()
+        os.replace(temp_path, path)
+        return size
+
+    def load(self) -> dict:
+        os.makedirs(self.groups_path, exist_ok=True)
+        if not os.path.isfile(self.index_path):
+            return self.import_journal()
+        with open(self.index_path) as f:
+            self.index = yaml.safe_load(f)
+        groups: VigilGroupMap = VigilGroupMap(self.load_group)
+        for group_id, summary in self.index['groups'].items():
+            if summary['dormant']:
+                groups.unloaded.add(group_id)
+                continue
+            group: VigilGroup or None = self.load_group(group_id)
+            if group:
+                groups[group_id] = group
+        logger.info('%s groups loaded from "%s", %s left dormant' % (
+            len(groups), self.data_path, len(groups.unloaded)
+        ))
+        checkpoint: float or None = self.index.get('checkpoint', None)
+        return {
+            'groups': groups, 'admins': list(self.index['admins']),
+            'checkpoint': VigilClock.from_epoch(checkpoint) if checkpoint else None
+        }
+
+    @classmethod
+    def exists(cls, data_path: str) -> bool:  # Or the data to import on the first start
+        return os.path.exists(data_path) or VigilJournal.exists(cls.import_path(data_path))
+
+    @staticmethod
+    def import_path(data_path: str) -> str:  # Snapshot of the default backend next to the directory, data -> data.yaml
+        return data_path + '.yaml'
+
+    def import_journal(self) -> dict:  # First start, carry over the data of the default backend if there is any
+        data: dict = VigilJournal(self.import_path(self.data_path)).load()
+        groups: VigilGroupMap = VigilGroupMap(self.load_group)
+        groups.update(data['groups'])
+        for group in groups.values():
+            self.changed[group.id] = group
+        self.index['admins'] = list(data['admins'])
+        if data['checkpoint']:
+            self.index['checkpoint'] = VigilClock.to_epoch(data['checkpoint'])
+        self.index_changed = True
+        logger.info('%s groups imported from "%s"' % (len(groups), self.import_path(self.data_path)))
+        return {'groups': groups, 'admins': data['admins'], 'checkpoint': data['checkpoint']}
+
+    def load_group(self, group_id: int) -> VigilGroup or None:
+        if not os.path.isfile(self.group_path(group_id)):
+            return None
+        with open(self.group_path(group_id)) as f:
+            group: VigilGroup or dict = yaml.safe_load(f)
+        return VigilGroup.from_dict(group) if isinstance(group, dict) else group  # Older files are tagged
+
+    def save_group(self, group: VigilGroup):
+        self.changed[group.id] = group
+
+    def remove_group(self, group_id: int):
+        self.changed[group_id] = None
+
+    def add_admin(self, user_id: int):
+        if user_id not in self.index['admins']:
+            self.index['admins'].append(user_id)
+            self.index_changed = True
+
+    def set_checkpoint(self, time: datetime):
+        self.index['checkpoint'] = VigilClock.to_epoch(time)
+        self.index_changed = True
+
+    def record_group_event(self, group: VigilGroup, event: str, **kwargs):
+        self.changed[group.id] = group
+
+    def import_data(self, data: dict):
+        os.makedirs(self.groups_path, exist_ok=True)
+        self.index_changed = True  # Even when empty, a missing index would import the default journal on load
+        super().import_data(data)
+
+    @property
+    def dirty(self) -> bool:
+        return bool(self.changed) or self.index_changed
+
+    def take_pending(self) -> list:
+        pending: list = list()
+        for group_id, group in self.changed.items():
+            if group is None:
+                self.index_changed |= self.index['groups'].pop(group_id, None) is not None
+                pending.append((group_id, None))
+                continue
+            summary: dict = {'dormant': group.is_dormant()}
+            if self.index['groups'].get(group_id, None) != summary:
+                self.index['groups'][group_id] = summary
+                self.index_changed = True
+            pending.append((group_id, group.to_dict()))
+        self.changed = dict()
+        if self.index_changed:
+            pending.append((None, copy.deepcopy(self.index)))
+            self.index_changed = False
+        return pending
+
+    def write_pending(self, pending: list) -> int:
+        if not pending:
+            return 0
+        size: int = 0
+        for (group_id, content) in pending:
+            if group_id is None:
+                size += self.write_file(self.index_path, content)
+            elif content is None:
+                if os.path.isfile(self.group_path(group_id)):
+                    os.remove(self.group_path(group_id))
+            else:
+                size += self.write_file(self.group_path(group_id), content)
+        logger.info('%s files written to "%s"' % (len(pending), self.data_path))
+        return size
+
+    def compact(self, snapshot: dict or None):
+        self.flush()
+
+
+class VigilArchive(object):  # Winners past the retention period, one gzipped file of ujson lines per group and month
+    def __init__(self, path: str):
+        self.path: str = path
+
+    @staticmethod
+    def month_of(date: str) -> str:
+        return date[:7].replace('/', '-')
+
+    def file_path(self, group_id: int, month: str) -> str:
+        return os.path.join(self.path, str(group_id), '%s.jsonl.gz' % month)
+
+    def append(self, group_id: int, records: list):  # Blocking, records are (date, offset, VigilWinner)
+        lines: dict = dict()
+        for (date, offset, winner) in records:
+            lines.setdefault(self.month_of(date), list()).append(ujson.dumps({
+                'date': date,
+                'offset': offset,
+                'winner': winner.to_dict()
+            }, ensure_ascii=False) + '\n')
+        if not lines:
+            return
+        os.makedirs(os.path.join(self.path, str(group_id)), exist_ok=True)
+        for month, month_lines in lines.items():
+            with gzip.open(self.file_path(group_id, month), 'at', encoding='utf-8') as f:  # Appended as a new member
+                f.write(''.join(month_lines))
+        logger.info('%s winners of group "%s" archived' % (len(records), group_id))
+
+    def query(self, group_id: int, start: str, end: str) -> list:  # Blocking, inclusive range of '%Y/%m/%d' dates
+        group_path: str = os.path.join(self.path, str(group_id))
+        if not os.path.isdir(group_path):
+            return list()
+        (first, last) = (self.month_of(start), self.month_of(end))
+        result: dict = dict()  # Records archived twice after a crash are merged here
+        for name in sorted(os.listdir(group_path)):
+            month: str = name.split('.', maxsplit=1)[0]
+            if (month < first) or (month > last):
+                continue
+            try:
+                with gzip.open(os.path.join(group_path, name), 'rt', encoding='utf-8') as f:
+                    for line in f:
+                        record: dict = ujson.loads(line)
+                        if start <= record['date'] <= end:
+                            result[(record['date'], record['offset'])] = VigilWinner.from_dict(record['winner'])
+            except (EOFError, OSError, ValueError):
+                logger.warning('Truncated archive "%s", ignoring the rest' % name)
+        return [(date, offset, winner) for ((date, offset), winner) in sorted(result.items(), key=lambda x: x[0])]
+
+
+class VigilShard(object):  # A worker process owning the master groups assigned to it, and its queues to the front
+    def __init__(self, index: int, count: int, inbox: multiprocessing.Queue, events: multiprocessing.Queue):
+        self.index: int = index
+        self.count: int = count
+        self.inbox: multiprocessing.Queue = inbox  # Updates and instructions from the front process
+        self.events: multiprocessing.Queue = events  # Shared by every worker, read by the front process
+
+    @staticmethod
+    def owner(group_id: int, count: int) -> int:  # Slave groups belong to the worker of their master
+        return abs(group_id) % count
+
+    @staticmethod
+    def get_path(data_path: str, index: int, count: int) -> str:
+        return '%s.%s-of-%s' % (data_path, index, count)
+
+    def owns(self, group_id: int) -> bool:
+        return self.owner(group_id, self.count) == self.index
+
+    def notify(self, event: str, *args):
+        self.events.put((event, self.index) + args)
+
+    def receive(self) -> tuple or None:  # Blocking, None once the front process is gone
+        while True:
+            try:
+                return self.inbox.get(timeout=1)
+            except queue.Empty:
+                parent: multiprocessing.process.BaseProcess or None = multiprocessing.parent_process()
+                if parent and (not parent.is_alive()):
+                    logger.warning('Front process is gone, stopping worker %s' % self.index)
+                    return None
 
 
 class VigilBot(object):
-    def __init__(self, token: str, admins: list, data_path: str = 'data.yaml'):
+    ALLOWED_UPDATES: list = types.AllowedUpdates.MESSAGE + types.AllowedUpdates.CHAT_MEMBER + \
+        types.AllowedUpdates.MY_CHAT_MEMBER
+    ANNOUNCEMENT_DELAY: timedelta = timedelta(minutes=5)  # Later match announcements are skipped
+    CHECKPOINT_INTERVAL: timedelta = timedelta(minutes=1)  # Between checkpoints written on their own
+    MEMBER_RATE: float = 10  # getChatMember calls per second of the whole bot, when refreshing names
+
+    def __init__(
+            self, token: str,
+            admins: list,
+            data_path: str or None = None,
+            storage: str = 'journal',
+            member_cache_size: int = 10000,
+            member_cache_ttl: int = 43200,
+            persist_interval: int = 5,
+            winner_retention: int = 7,
+            vectorized_resolver: bool = False,
+            bot: Bot or None = None,
+            metrics_address: tuple or None = None,
+            shard: VigilShard or None = None
+    ):
         self.id: int = int(token.split(':', maxsplit=1)[0])
-        self.bot: Bot = Bot(token=token)
+        self.metrics: VigilMetrics = VigilMetrics()
+        self.metrics_address: tuple or None = metrics_address  # (host, port) of the optional metrics endpoint
+        self.bot: Bot = bot or Bot(token=token)
+        self.bot.request = self.metrics.timed_request(self.bot.request)  # Every API call goes through request
         self.dispatcher: Dispatcher = Dispatcher(self.bot)
         self.scheduler: AsyncIOScheduler = AsyncIOScheduler()
+        self.shard: VigilShard or None = shard
+        self.outbox: VigilOutbox = VigilOutbox(  # The global limit of the bot is split among the workers
+            self.bot, global_rate=VigilOutbox.GLOBAL_RATE / (shard.count if shard else 1)
+        )
+        self.tasks: set = set()  # Updates being handled by a worker
+        self.webhook: dict or None = None
+        self.allowed_updates: list = self.ALLOWED_UPDATES
         self.strings = VigilStrings()
-        self.data_path: str = data_path
+        self.storage: VigilStorage = VigilStorage.create(storage, data_path)
+        self.data_path: str = self.storage.data_path
+        self.persistence: ThreadPoolExecutor = ThreadPoolExecutor(max_workers=1)  # Keeps writes in order
+        self.persist_interval: int = persist_interval
+        self.archive: VigilArchive = VigilArchive(self.data_path + '.archive')
+        self.winner_retention: int = max(winner_retention, 2)  # Winners of yesterday may not be broadcast yet
         self.data: dict = dict()
+        self.unplanned_groups: set = set()
+        self.planning: bool = False
+        self.resolver: VigilResolver = VigilResolver(vectorized=vectorized_resolver)
+        if vectorized_resolver and (not self.resolver.vectorized):
+            logger.warning('numpy is not installed, matches are decided group by group')
+        self.resolving: dict = dict()  # Decision time -> (groups, future), matches decided together
+        self.running_matches: dict = dict()  # Group ID -> decision time, until the next match has been planned
+        self.participants: dict = dict()  # Master group ID -> IDs of users in hall, checked before anything else
+        self.redirects: dict = dict()  # Slave group ID -> master group ID
         self.load_data()
-        if not self.data:
-            self.data = dict()
-        if 'groups' not in self.data.keys():
-            self.data['groups']: dict = dict()
-        for group in self.data['groups'].values():
-            logger.info('Inspecting group with ID "%s"' % group.id)
-            group.check_integrity()
-            self.data['groups'][group.id] = group
-        if 'admins' not in self.data.keys():
-            self.data['admins']: list = list()
-        self.data['admins']: list = list(set(self.data['admins'] + admins))
+        for admin in admins:
+            self.add_admin(admin)
         self.dump_data()
-        self.chat_members: dict = dict()
+        self.chat_members: VigilMemberCache = VigilMemberCache(
+            self.bot.get_chat_member, max_size=member_cache_size, ttl=timedelta(seconds=member_cache_ttl)
+        )
+        self.chat_members.on_change = self.handle_member_change  # Rendered lists show the names
+        self.permissions: VigilPermissionCache = VigilPermissionCache(self.bot.get_chat_member)
+        member_rate: float = self.MEMBER_RATE / (shard.count if shard else 1)  # Split among the workers like the outbox
+        self.member_limiter: VigilRateLimiter = VigilRateLimiter(rate=member_rate, capacity=max(int(member_rate), 1))
+        self.member_refresh_workers: int = 4
+        self.member_refresh_interval: timedelta = timedelta(hours=1)  # Fresher records are not refreshed again
+        self.member_refresh_lock: asyncio.Lock = asyncio.Lock()
+        for (name, cache) in (('members', self.chat_members), ('permissions', self.permissions)):
+            self.metrics.gauge('cache_%s' % name, 'stat', cache.get_stats)
+        self.metrics.gauge('outbox', 'stat', lambda: {
+            'queued': self.outbox.queue.qsize() if self.outbox.queue else 0
+        })
+        self.scheduler.add_listener(self.handle_job_overrun, EVENT_JOB_MISSED | EVENT_JOB_MAX_INSTANCES)
+        self.scheduler.add_listener(self.handle_match_done, EVENT_JOB_EXECUTED | EVENT_JOB_ERROR)
+        self.timed_run_match = self.metrics.timed('job', 'job', 'run_match', self.run_match)
+
+    async def answer(self, message: types.Message, text: str) -> SendMessage or None:
+        if self.webhook:  # Sent back in the response to the webhook request, saves a round trip
+            return SendMessage(message.chat.id, text).reply(message)
+        await message.reply(text)
 
     def html_escape_for_the_damn_parser_of_telegram(self, text):
         try:
@@ -370,24 +2076,130 @@ class VigilBot(object):
             return self.strings.INVALID_STRING
 
     def load_data(self):
-        if os.path.isfile(self.data_path):
-            with open(self.data_path) as f:
-                self.data = yaml.safe_load(f)
-                logger.info('Data loaded from "%s"' % self.data_path)
-
-    def dump_data(self):
-        with open(self.data_path, 'w+') as f:
-            yaml.safe_dump(self.data, f)
+        self.data = self.storage.load()
+        for group in self.data['groups'].values():
+            self.attach_group(group)
+        if isinstance(self.data['groups'], VigilGroupMap):
+            self.data['groups'].on_load = self.attach_group
+        self.index_participants()
+        logger.info('Data loaded from "%s"' % self.data_path)
+
+    def attach_group(self, group: VigilGroup):
+        group.observer = self.handle_group_event
+        group.reset_index()
+
+    def index_participants(self):
+        self.participants = dict()
+        self.redirects = dict()
+        for group in self.data['groups'].values():
+            if not group.master:
+                self.redirects[group.id] = group.slave_of
+            if group.hall:
+                self.participants[group.id] = set(group.hall.keys())
+
+    def is_participant(self, chat_id: int, user_id: int) -> bool:
+        user_ids: set or None = self.participants.get(self.redirects.get(chat_id, chat_id), None)
+        return (user_ids is not None) and (user_id in user_ids)
+
+    def dump_data(self):  # Blocking, only for startup and shutdown
+        self.storage.compact(self.storage.snapshot(self.data))
+        logger.info('Data dumped to "%s"' % self.data_path)
+
+    def handle_group_event(self, group: VigilGroup, event: str, **kwargs):
+        self.storage.record_group_event(group, event, **kwargs)
+        if event == 'hall':
+            self.participants.setdefault(group.id, set()).add(kwargs['user'].id)
+        elif event == 'enroll':
+            self.participants.setdefault(group.id, set()).update(user.id for user in kwargs['users'])
+        elif event == 'remove':
+            user_ids: set or None = self.participants.get(group.id, None)
+            if user_ids is not None:
+                user_ids.discard(kwargs['user_id'])
+                if not user_ids:
+                    del self.participants[group.id]
+        if event not in ('active', 'winner', 'expire', 'stats'):
+            self.plan_match_later(group.id)
+
+    def get_checkpoint(self) -> datetime:  # Every decision point up to it has been handled
+        checkpoint: datetime = VigilClock.utcnow()
+        for job in self.scheduler.get_jobs():
+            if job.id.startswith('match:'):
+                checkpoint = min(checkpoint, job.args[1] - timedelta(microseconds=1))
+        for decision_time in self.running_matches.values():
+            checkpoint = min(checkpoint, decision_time - timedelta(microseconds=1))
+        return checkpoint
+
+    def update_checkpoint(self, force: bool = False):  # Written along with other changes, or once in a while
+        checkpoint: datetime = self.get_checkpoint()
+        previous: datetime or None = self.data.get('checkpoint', None)
+        if previous and ((checkpoint <= previous) or (
+                (not force) and (not self.storage.dirty) and (checkpoint - previous < self.CHECKPOINT_INTERVAL)
+        )):
+            return
+        self.data['checkpoint'] = checkpoint
+        self.storage.set_checkpoint(checkpoint)
+
+    async def flush_data(self):
+        self.update_checkpoint()
+        if self.storage.dirty:
+            pending: list = self.storage.take_pending()
+            started: float = time.perf_counter()
+            size: int = await asyncio.get_event_loop().run_in_executor(
+                self.persistence, self.storage.write_pending, pending
+            )
+            self.metrics.observe('persistence_write_seconds', 'storage', self.storage.name, time.perf_counter() - started)
+            self.metrics.inc('persistence_records', 'storage', self.storage.name, len(pending))
+            self.metrics.inc('persistence_bytes', 'storage', self.storage.name, size)
+
+    async def compact_data(self):
+        if self.storage.need_compaction():
+            started: float = time.perf_counter()
+            await asyncio.get_event_loop().run_in_executor(
+                self.persistence, self.storage.compact, self.storage.snapshot(self.data)
+            )
+            self.metrics.observe('persistence_compact_seconds', 'storage', self.storage.name, time.perf_counter() - started)
             logger.info('Data dumped to "%s"' % self.data_path)
 
+    async def archive_winners(self):
+        before: str = (VigilClock.utcnow() - timedelta(days=self.winner_retention - 1)).strftime('%Y/%m/%d')
+        for group in list(self.data['groups'].values()):
+            records: list = group.expire_winners(before)
+            if records:  # Same thread as the storage writes, so the archive is written before the expiry
+                await asyncio.get_event_loop().run_in_executor(self.persistence, self.archive.append, group.id, records)
+
+    async def query_winners(self, group: VigilGroup, start: str, end: str) -> list:
+        records: dict = dict()
+        for (date, offset, winner) in await asyncio.get_event_loop().run_in_executor(
+                None, self.archive.query, group.id, start, end
+        ) + group.query_winners(start, end):
+            records[(date, offset)] = winner  # Hot records take precedence
+        return [(date, offset, winner) for ((date, offset), winner) in sorted(records.items(), key=lambda x: x[0])]
+
+    async def rebuild_stats(self):  # Offline, from the archive and the winners still in memory
+        if isinstance(self.data['groups'], VigilGroupMap):
+            for group_id in list(self.data['groups'].unloaded):
+                self.data['groups'].load(group_id)
+        for group in list(self.data['groups'].values()):
+            if group.master:
+                group.rebuild_stats(await self.query_winners(group, '', '~'))
+                logger.info('Statistics of group "%s" rebuilt, %s winners counted' % (group.id, group.stats.matches))
+
     def add_group(self, group_id: int, master: bool = True, slave_of: int = 0):
         if group_id >= 0:
             logger.info('Invalid group ID')
             return
-        if group_id not in self.data['groups'].keys():
+        if self.shard and (not self.shard.owns(group_id if master else slave_of)):
+            self.shard.notify('forward', group_id if master else slave_of, 'add_group', (group_id, master, slave_of))
+            return
+        if group_id not in self.data['groups']:
             self.data['groups'][group_id]: VigilGroup = VigilGroup(group_id, master=master, slave_of=slave_of)
+            self.data['groups'][group_id].observer = self.handle_group_event
+            if not master:
+                self.redirects[group_id] = slave_of
+                if self.shard:
+                    self.shard.notify('redirect', group_id, slave_of)
             logger.info('Group with ID "%s" has been added' % group_id)
-            self.dump_data()
+            self.update_group(self.data['groups'][group_id])
 
     def get_group(self, group_id: int, follow_redir: bool = False) -> VigilGroup or None:
         group: VigilGroup or None = self.data['groups'].get(group_id, None)
@@ -402,9 +2214,23 @@ class VigilBot(object):
         if group.id in self.data['groups'].keys():
             self.data['groups'][group.id] = group
             logger.info('Group with ID "%s" has been updated' % group.id)
-            self.dump_data()
+            self.storage.save_group(group)
+            self.plan_match_later(group.id)
+
+    def remove_group(self, group: VigilGroup):
+        if group.id in self.data['groups'].keys():
+            del self.data['groups'][group.id]
+            group.observer = None
+            self.participants.pop(group.id, None)
+            if (self.redirects.pop(group.id, None) is not None) and self.shard:
+                self.shard.notify('redirect', group.id, None)
+            self.storage.remove_group(group.id)
+            self.plan_match_later(group.id)
 
     def hall_status(self, group) -> str or None:
+        renders: dict = group.get_renders()
+        if 'status' in renders.keys():
+            return renders['status']
         content: str = ''
         for offset, (timezones, users) in group.i_dont_know_how_to_name_this_method().items():
             if len(users) > 0:
@@ -413,23 +2239,16 @@ class VigilBot(object):
                     timezone=', '.join(timezones),
                     number=len(users)
                 ) + '\n'
-        if content != '':
-            return content
-        else:
-            return None
+        renders['status'] = content or None
+        return renders['status']
 
     async def is_admin(self, group: VigilGroup) -> bool:
-        bot: types.ChatMember = await self.bot.get_chat_member(group.id, self.id)
-        return bot.is_admin()
+        return await self.permissions.get(group.id, self.id)
 
     async def is_valid(self, group: VigilGroup, message: types.Message) -> bool:
         if not group:
             return False
-        try:
-            member: types.ChatMember = await self.bot.get_chat_member(group.id, message.from_user.id)
-        except utils.exceptions.BadRequest:
-            return False
-        return member.is_admin()
+        return await self.permissions.get(group.id, message.from_user.id)
 
     async def update_title(self, group: VigilGroup):
         if group.title_enabled:
@@ -437,9 +2256,8 @@ class VigilBot(object):
                 group.title_enabled = False
                 self.update_group(group)
                 return
-            timezone: pytz.timezone = pytz.timezone(group.timezone)
-            localtime: datetime = pytz.utc.localize(datetime.utcnow(), is_dst=None).astimezone(timezone)
-            await self.bot.set_chat_title(
+            localtime: datetime = VigilTime.get_local_time(group.timezone)
+            self.outbox.set_chat_title(
                 group.id,
                 group.title_template.format(
                     yeshu_year=int(localtime.year - 1988),
@@ -449,96 +2267,211 @@ class VigilBot(object):
             logger.info('Title updated for group with ID "%s"' % group.id)
 
     async def update_title_all(self):
-        for group in self.data['groups'].values():
-            await self.update_title(group)
+        await asyncio.gather(*[self.update_title(group) for group in list(self.data['groups'].values())])
         logger.info('All titles have been updated')
 
     async def maintain_user_list(self):
-        for group in self.data['groups'].values():
-            for user_id in (list(group.hall.keys()) + list(group.auto_join.keys())):
-                try:
-                    chat_member: types.ChatMember = await self.bot.get_chat_member(group.id, user_id)
-                    self.chat_members[user_id]: VigilChatMember = VigilChatMember(chat_member.user)
-                except utils.exceptions.BadRequest:
-                    try:
-                        del group.hall[user_id]
-                        del group.auto_join[user_id]
-                    except KeyError:
-                        pass
-                await asyncio.sleep(3) # Avoid banning
-            self.update_group(group)
-
-    async def get_member_name(self, user_id: int, group_id: int) -> VigilChatMember:
-        if user_id not in self.chat_members.keys() or\
-                (self.chat_members[user_id].record_time + timedelta(hours=12) < datetime.utcnow()):
-            logger.info('No valid user information cache found for user "%s", fetching...' % user_id)
+        if self.member_refresh_lock.locked():
+            logger.info('Previous user list maintenance is still running, skipped')
+            return
+        async with self.member_refresh_lock:
+            fresh_time: datetime = VigilClock.utcnow() - self.member_refresh_interval
+            members: list = list()
+            for group in self.data['groups'].values():
+                for user_id in set(group.hall.keys()) | set(group.auto_join.keys()):
+                    chat_member: VigilChatMember or None = self.chat_members.peek(group.id, user_id)
+                    record_time: datetime = chat_member.record_time if chat_member else datetime.min
+                    if record_time < fresh_time:
+                        members.append((record_time, group.id, user_id))
+            members.sort()  # Stalest first
+            queue: asyncio.Queue = asyncio.Queue()
+            for (_, group_id, user_id) in members:
+                queue.put_nowait((group_id, user_id))
+            await asyncio.gather(*[self.refresh_members(queue) for _ in range(self.member_refresh_workers)])
+            logger.info('Information of %s users refreshed, member cache: %s' % (
+                len(members), self.chat_members.get_stats()
+            ))
+
+    async def refresh_members(self, queue: asyncio.Queue):
+        while not queue.empty():
+            (group_id, user_id) = queue.get_nowait()
+            await self.member_limiter.acquire()
             try:
                 chat_member: types.ChatMember = await self.bot.get_chat_member(group_id, user_id)
+            except utils.exceptions.RetryAfter as e:
+                logger.warning('Flood control exceeded, waiting for %s seconds' % e.timeout)
+                queue.put_nowait((group_id, user_id))
+                await asyncio.sleep(e.timeout)
+                continue
             except utils.exceptions.BadRequest:
-                return VigilChatMember()
-            self.chat_members[user_id]: VigilChatMember = VigilChatMember(chat_member.user)
-        return self.chat_members[user_id]
+                self.chat_members.put(group_id, user_id, VigilChatMember(), negative=True)
+                group: VigilGroup or None = self.get_group(group_id)
+                if group:
+                    group.remove_user(user_id)
+                    group.remove_auto_join(user_id)
+                continue
+            except utils.exceptions.TelegramAPIError as e:
+                logger.warning('Failed to fetch user "%s" in group "%s": %s' % (user_id, group_id, e))
+                continue
+            self.chat_members.put(group_id, user_id, VigilChatMember(chat_member.user))
+
+    async def get_member_name(self, user_id: int, group_id: int) -> VigilChatMember:
+        return await self.chat_members.get(group_id, user_id)
+
+    async def get_member_names(self, user_ids: list, group_id: int) -> list:  # A few fetches at a time, in order
+        semaphore: asyncio.Semaphore = asyncio.Semaphore(self.member_refresh_workers)
+
+        async def get(user_id: int) -> VigilChatMember:
+            async with semaphore:
+                return await self.get_member_name(user_id, group_id)
+
+        return list(await asyncio.gather(*[get(user_id) for user_id in user_ids]))
+
+    def handle_member_change(self, group_id: int, user_id: int):
+        group: VigilGroup or None = self.data['groups'].get(group_id, None)
+        if group and (user_id in group.hall.keys()):
+            group.clear_renders()
 
     async def broadcast_winner(self):
-        now = datetime.utcnow()
-        date: str = now.strftime('%Y/%m/%d')
+        now: datetime = VigilClock.utcnow()
         for group in self.data['groups'].values():
-            if not group.master:
-                continue
-            group.find_winner()
-            self.update_group(group)
+            if group.master:
+                await self.broadcast_group_winner(group, now)
+
+    async def broadcast_group_winner(self, group: VigilGroup, now: datetime):
+        pending: list = list()  # Claimed before the first await, a concurrent call does not announce them again
+        for date in ((now - timedelta(days=1)).strftime('%Y/%m/%d'), now.strftime('%Y/%m/%d')):
             if date not in group.winners.keys():
                 continue
-            result: str = ''
-            for offset, winner in group.winners[date].items():
+            for offset, winner in list(group.winners[date].items()):
                 if (not winner) or winner.broadcasted:
                     continue
-                tz: pytz.timezone = pytz.timezone(winner.timezones[0])
-                localized_time: datetime = pytz.utc.localize(winner.last_online, is_dst=None).astimezone(tz)
-                time_string: str = localized_time.strftime('%H:%M')
-                if group.delay_winner_broadcast and (localized_time.hour != group.stop_time):
+                if group.delay_winner_broadcast and \
+                        (VigilTime.get_local_time(winner.timezones[0], now).hour != group.stop_time):
                     continue
-                user: VigilChatMember = await self.get_member_name(winner.id, group.id)
-                user_name: str = self.html_escape_for_the_damn_parser_of_telegram(user.name)
-                result += self.strings.WINNER_FOUND.format(
-                    offset=offset,
-                    timezone=self.html_escape_for_the_damn_parser_of_telegram(', '.join(winner.timezones)),
-                    user='<a href="tg://user?id=%s">%s</a>' % (user.id, user_name),
-                    time=time_string
-                ) + '\n'
                 winner.broadcasted = True
                 group.update_winner(date, offset, winner)
-            self.update_group(group)
-            if result and group.broadcast_winner:
-                await self.bot.send_message(group.id, result, parse_mode='HTML', disable_notification=True)
+                pending.append((offset, winner))
+        result: str = ''
+        for (offset, winner) in pending:
+            localized_time: datetime = VigilTime.get_local_time(winner.timezones[0], winner.last_online)
+            time_string: str = localized_time.strftime('%H:%M')
+            user: VigilChatMember = await self.get_member_name(winner.id, group.id)
+            user_name: str = self.html_escape_for_the_damn_parser_of_telegram(user.name)
+            result += self.strings.WINNER_FOUND.format(
+                offset=offset,
+                timezone=self.html_escape_for_the_damn_parser_of_telegram(', '.join(winner.timezones)),
+                user='<a href="tg://user?id=%s">%s</a>' % (user.id, user_name),
+                time=time_string
+            ) + '\n'
+        if result and group.broadcast_winner:
+            self.outbox.send_message(
+                group.id, result, VigilOutbox.WINNER, parse_mode='HTML', disable_notification=True
+            )
 
-    async def broadcast_match_start(self):
-        now = datetime.utcnow()
-        for group in self.data['groups'].values():
-            if (not group.broadcast_status) or (not group.master):
-                continue
-            for offset, (timezones, users) in group.i_dont_know_how_to_name_this_method().items():
-                if len(users) > 0:
-                    tz: pytz.timezone = pytz.timezone(timezones[0])
-                    localized_time: datetime = pytz.utc.localize(now, is_dst=None).astimezone(tz)
-                    prepare_time: int = (24 + group.start_time - 1) % 24
-                    if (localized_time.hour == group.start_time) and (localized_time.minute == 0):
-                        await self.bot.send_message(
-                            group.id,
-                            self.strings.MATCH_START_BROADCAST.format(
-                                offset=offset,
-                                timezone=', '.join(timezones),
-                                number=len(users)
-                            )
-                        )
-                    elif (localized_time.hour == prepare_time) and (localized_time.minute == 0):
-                        await self.bot.send_message(
-                            group.id,
-                            self.strings.MATCH_GOING_TO_START_BROADCAST.format(
-                                offset=offset,
-                                timezone=', '.join(timezones)
-                            )
-                        )
+    async def broadcast_match_start(self, group: VigilGroup, now: datetime):
+        if (not group.broadcast_status) or (not group.master):
+            return
+        for offset, (timezones, users) in group.i_dont_know_how_to_name_this_method(now).items():
+            if len(users) > 0:
+                localized_time: datetime = VigilTime.get_local_time(timezones[0], now)
+                prepare_time: int = (24 + group.start_time - 1) % 24
+                if (localized_time.hour == group.start_time) and (localized_time.minute == 0):
+                    self.outbox.send_message(
+                        group.id,
+                        self.strings.MATCH_START_BROADCAST.format(
+                            offset=offset,
+                            timezone=', '.join(timezones),
+                            number=len(users)
+                        ),
+                        VigilOutbox.MATCH
+                    )
+                elif (localized_time.hour == prepare_time) and (localized_time.minute == 0):
+                    self.outbox.send_message(
+                        group.id,
+                        self.strings.MATCH_GOING_TO_START_BROADCAST.format(
+                            offset=offset,
+                            timezone=', '.join(timezones)
+                        ),
+                        VigilOutbox.MATCH
+                    )
+
+    def plan_match(self, group_id: int, after: datetime or None = None):  # Planned after the last handled instant
+        job_id: str = 'match:%s' % group_id
+        group: VigilGroup or None = self.get_group(group_id)
+        if after is None:
+            after = VigilClock.utcnow()
+            job = self.scheduler.get_job(job_id)
+            if job and (job.args[1] <= after):  # Overdue, it is still replayed after a mutation
+                after = job.args[1] - timedelta(microseconds=1)
+        decision_time: datetime or None = group.next_decision_time(after) if group else None
+        if not decision_time:
+            if self.scheduler.get_job(job_id):
+                self.scheduler.remove_job(job_id)
+            return
+        self.scheduler.add_job(
+            self.timed_run_match, 'date',
+            run_date=pytz.utc.localize(decision_time),
+            args=[group_id, decision_time],
+            id=job_id,
+            replace_existing=True,
+            misfire_grace_time=None
+        )
+        logger.info('Next decision for group "%s" planned at %s UTC' % (group_id, decision_time))
+
+    def plan_match_later(self, group_id: int):  # Coalesces the re-planning of multiple mutations
+        self.unplanned_groups.add(group_id)
+        if not self.planning:
+            self.planning = True
+            asyncio.get_event_loop().call_soon(self.plan_unplanned_matches)
+
+    def plan_unplanned_matches(self):
+        self.planning = False
+        group_ids: set = self.unplanned_groups
+        self.unplanned_groups = set()
+        for group_id in group_ids:
+            self.plan_match(group_id)
+
+    async def run_match(self, group_id: int, decision_time: datetime):
+        group: VigilGroup or None = self.get_group(group_id)
+        if not group:
+            return
+        self.running_matches[group_id] = decision_time  # Until handle_match_done has planned the next one
+        delay: timedelta = VigilClock.utcnow() - decision_time
+        if delay <= self.ANNOUNCEMENT_DELAY:
+            await self.broadcast_match_start(group, decision_time)
+        else:  # Missed while the bot was down or the loop was blocked, only decided now
+            self.metrics.inc('match_replays', 'job', 'run_match')
+            logger.warning('Decision at %s UTC for group "%s" replayed %s late' % (decision_time, group_id, delay))
+        await self.resolve_match(group, decision_time)
+        await self.broadcast_group_winner(group, decision_time)
+
+    def handle_match_done(self, event):  # Planned once the job is done, a running instance would block an overdue one
+        if not event.job_id.startswith('match:'):
+            return
+        group_id: int = int(event.job_id.split(':', maxsplit=1)[1])
+        decision_time: datetime or None = self.running_matches.get(group_id, None)
+        if decision_time is not None:
+            self.plan_match(group_id, after=decision_time)  # The next one may be overdue as well, replayed in order
+            self.running_matches.pop(group_id, None)
+
+    async def resolve_match(self, group: VigilGroup, decision_time: datetime):
+        if decision_time not in self.resolving.keys():  # Every match job started in this loop iteration joins
+            self.resolving[decision_time] = (list(), asyncio.get_event_loop().create_future())
+            asyncio.get_event_loop().call_soon(self.resolve_matches, decision_time)
+        (groups, future) = self.resolving[decision_time]
+        groups.append(group)
+        await asyncio.shield(future)
+
+    def resolve_matches(self, decision_time: datetime):
+        (groups, future) = self.resolving.pop(decision_time)
+        try:
+            self.resolver.resolve(groups, decision_time)
+        except Exception as e:
+            future.set_exception(e)
+            return
+        future.set_result(len(groups))
+        logger.info('Matches of %s groups decided at %s UTC' % (len(groups), decision_time))
 
     async def broadcast_hall_status(self):
         for group in self.data['groups'].values():
@@ -546,7 +2479,7 @@ class VigilBot(object):
                 continue
             content = self.hall_status(group)
             if content:
-                await self.bot.send_message(group.id, content)
+                self.outbox.send_message(group.id, content, VigilOutbox.STATUS)
 
     async def handler_add_admin(self, message: types.Message):
         if message.from_user.id in self.data['admins']:
@@ -558,15 +2491,21 @@ class VigilBot(object):
             response: str = ''
             for single_id in ids:
                 try:
-                    if single_id not in self.data['admins']:
-                        self.data['admins'].append(int(single_id))
-                        self.dump_data()
+                    if int(single_id) not in self.data['admins']:
+                        self.add_admin(int(single_id))
+                        if self.shard:
+                            self.shard.notify('admin', int(single_id))
                     response += str(self.strings.ADMIN_ADDED.format(id=str(single_id)) + '\n')
                 except ValueError:
                     response += str(self.strings.ID_INVALID.format(id=str(single_id)) + '\n')
                     continue
             await message.reply(response)
 
+    def add_admin(self, user_id: int):
+        if user_id not in self.data['admins']:
+            self.data['admins'].append(user_id)
+            self.storage.add_admin(user_id)
+
     async def handler_add_group(self, message: types.Message):
         if message.from_user.id in self.data['admins']:
             try:
@@ -599,7 +2538,7 @@ class VigilBot(object):
             return
         group: VigilGroup or None = self.get_group(message.chat.id)
         if group:
-            del self.data['groups'][group.id]
+            self.remove_group(group)
         self.add_group(message.chat.id, master=False, slave_of=master)
         await message.reply(self.strings.GROUP_ADDED.format(id=master))  # Because I'm too lazy to write another string.
 
@@ -688,7 +2627,7 @@ class VigilBot(object):
         group: VigilGroup or None = self.get_group(message.chat.id)
         if group and (await self.is_valid(group, message)):
             if group.title_enabled:
-                group.title_enable = False
+                group.title_enabled = False
                 self.update_group(group)
             await message.reply(self.strings.TITLE_DISABLED)
 
@@ -716,9 +2655,9 @@ class VigilBot(object):
         if group and group.enabled and group.master:
             response = self.hall_status(group)
             if response:
-                await message.reply(response)
+                return await self.answer(message, response)
             else:
-                await message.reply(self.strings.STATUS_EMPTY)
+                return await self.answer(message, self.strings.STATUS_EMPTY)
 
     async def handler_update_mode(self, message: types.Message):
         group: VigilGroup or None = self.get_group(message.chat.id)
@@ -855,19 +2794,12 @@ class VigilBot(object):
             if timezone not in pytz.all_timezones:
                 await message.reply(self.strings.TIMEZONE_INVALID)
                 return
-            tz: pytz.timezone = pytz.timezone(timezone)
-            localized_time: datetime = pytz.utc.localize(datetime.utcnow(), is_dst=None).astimezone(tz)
-            if group.start_time > group.stop_time:
-                if (localized_time.hour >= group.start_time) or (localized_time.hour < group.stop_time):
-                    await message.reply(self.strings.MATCH_STARTED.format(timezone=timezone))
-                    return
-            else:
-                if (localized_time.hour >= group.start_time) and (localized_time.hour < group.stop_time):
-                    await message.reply(self.strings.MATCH_STARTED.format(timezone=timezone))
-                    return
-            user = VigilUser(message.from_user.id, datetime.utcnow(), timezone=timezone)
+            localized_time: datetime = VigilTime.get_local_time(timezone)
+            if group.is_match_started(localized_time.hour):
+                await message.reply(self.strings.MATCH_STARTED.format(timezone=timezone))
+                return
+            user = VigilUser(message.from_user.id, VigilClock.utcnow(), timezone=timezone)
             group.update_hall(user)
-            self.update_group(group)
             logger.info('User with ID "%s" joined the contest in group "%s"' % (user.id, group.id))
             await message.reply(self.strings.JOINED.format(timezone=timezone))
 
@@ -876,9 +2808,8 @@ class VigilBot(object):
         if group and group.enabled and group.master:
             user: VigilUser or None = group.get_user(message.from_user.id)
             if user:
-                del group.hall[message.from_user.id]
+                group.remove_user(user.id)
                 logger.info('User with ID "%s" quit' % user.id)
-                self.update_group(group)
             await message.reply(self.strings.QUIT)
 
     async def handler_kick(self, message: types.Message):
@@ -894,9 +2825,8 @@ class VigilBot(object):
                 return
             user: VigilUser or None = group.get_user(user_id)
             if user:
-                del group.hall[user.id]
+                group.remove_user(user.id)
                 logger.info('User with ID "%s" kicked' % user.id)
-                self.update_group(group)
             user_name = await self.get_member_name(user_id, group.id)
             await message.reply(self.strings.KICKED.format(username=user_name.name))
 
@@ -916,12 +2846,10 @@ class VigilBot(object):
                 if timezone not in pytz.all_timezones:
                     await message.reply(self.strings.TIMEZONE_INVALID)
                     return
-                user: VigilUser = VigilUser(message.from_user.id, datetime.utcnow(), timezone=timezone)
-            user.active_time: list = list()
-            user.active_time.append(datetime.utcnow())
-            group.auto_join[user.id]: VigilUser = user
+                user: VigilUser = VigilUser(message.from_user.id, VigilClock.utcnow(), timezone=timezone)
+            user.reset_activity(VigilClock.utcnow())
+            group.update_auto_join(user)
             logger.info('User "%s" enabled auto join' % message.from_user.id)
-            self.update_group(group)
             await message.reply(self.strings.AUTO_JOIN_ENABLED.format(timezone=user.timezone))
 
     async def handler_disable_auto_join(self, message: types.Message):
@@ -929,9 +2857,8 @@ class VigilBot(object):
         if group and group.enabled and group.master:
             user: VigilUser or None = group.auto_join.get(message.from_user.id, None)
             if user:
-                del group.auto_join[user.id]
+                group.remove_auto_join(user.id)
                 logger.info('User "%s" disabled auto join' % message.from_user.id)
-                self.update_group(group)
             await message.reply(self.strings.AUTO_JOIN_DISABLED)
 
     async def handler_time(self, message: types.Message):
@@ -939,7 +2866,7 @@ class VigilBot(object):
         if (not group) or (not group.enabled):
             return
         user: VigilUser or None = group.get_user(message.from_user.id)
-        utc_time: datetime = datetime.utcnow()
+        utc_time: datetime = VigilClock.utcnow()
         try:
             timezone = str(message.text.split(' ', maxsplit=1)[1])
         except IndexError:
@@ -952,15 +2879,13 @@ class VigilBot(object):
                 else:
                     timezone: str = group.timezone
         if timezone not in pytz.all_timezones:
-            await message.reply(self.strings.TIMEZONE_INVALID)
-            return
-        tz: pytz.timezone = pytz.timezone(timezone)
-        localized_time: datetime = pytz.utc.localize(utc_time, is_dst=None).astimezone(tz)
+            return await self.answer(message, self.strings.TIMEZONE_INVALID)
+        localized_time: datetime = VigilTime.get_local_time(timezone, utc_time)
         response: str = self.strings.TIME_RESPONSE.format(
             timezone=timezone, time=localized_time.strftime('%H:%M')
         ) + '\n'
         response += self.strings.TIME_RESPONSE.format(timezone='UTC', time=utc_time.strftime('%H:%M'))
-        await message.reply(response)
+        return await self.answer(message, response)
 
     async def handler_list(self, message: types.Message):
         group: VigilGroup or None = self.get_group(message.chat.id)
@@ -975,30 +2900,104 @@ class VigilBot(object):
         except ValueError:
             await message.reply(self.strings.TIMEZONE_INVALID)
             return
+        renders: dict = group.get_renders()
+        response: str or None = renders.get(('list', timezone), None)
+        if response is None:
+            (response, complete) = await self.render_list(group, timezone)
+            if complete and (group.get_renders() is renders):  # Not cleared or rebuilt while names were fetched
+                renders[('list', timezone)] = response
+        if response:
+            await message.reply(response)
+
+    async def render_list(self, group: VigilGroup, timezone: str) -> tuple:  # (text, no name was left unknown)
         if not timezone:
             users_list: list = list(group.hall.values())
         elif timezone not in pytz.all_timezones:
             all_users: dict = group.i_dont_know_how_to_name_this_method()
             _, users_list = all_users.get(timezone, (None, None))
         else:
-            users_list: list = group.find_user_with_timezone(group.hall, timezone)
+            users_list: list = group.find_hall_user_with_timezone(timezone)
         if not users_list:
-            response = self.strings.STATUS_EMPTY
-        else:
-            response: str = ''
-            for user in users_list:
-                user_info: VigilChatMember = await self.get_member_name(user.id, group.id)
-                user_name: str = self.html_escape_for_the_damn_parser_of_telegram(user_info.name)
-                response += self.strings.LIST_MEMBER.format(name=user_name, timezone=user.timezone) + '\n'
-        if response:
-            await message.reply(response)
+            return self.strings.STATUS_EMPTY, True
+        response: str = ''
+        members: list = await self.get_member_names([user.id for user in users_list], group.id)
+        for (user, user_info) in zip(users_list, members):
+            user_name: str = self.html_escape_for_the_damn_parser_of_telegram(user_info.name)
+            response += self.strings.LIST_MEMBER.format(name=user_name, timezone=user.timezone) + '\n'
+        return response, all(user_info.id == user.id for (user, user_info) in zip(users_list, members))
+
+    async def handler_leaderboard(self, message: types.Message):
+        group: VigilGroup or None = self.get_group(message.chat.id)
+        if (not group) or (not group.enabled) or (not group.master):
+            return
+        if not group.stats.matches:
+            return await self.answer(message, self.strings.STATS_EMPTY)
+        response: str = ''
+        for rank, (user_id, wins) in enumerate(group.stats.top(10), start=1):
+            user_info: VigilChatMember = await self.get_member_name(user_id, group.id)
+            response += self.strings.LEADERBOARD_MEMBER.format(rank=rank, name=user_info.name, wins=wins) + '\n'
+        return await self.answer(message, response)
+
+    async def handler_stats(self, message: types.Message):
+        group: VigilGroup or None = self.get_group(message.chat.id)
+        if (not group) or (not group.enabled) or (not group.master):
+            return
+        stats: VigilStats = group.stats
+        if not stats.matches:
+            return await self.answer(message, self.strings.STATS_EMPTY)
+        response: str = self.strings.STATS_GROUP.format(
+            matches=stats.matches, time=stats.average_time(stats.minutes, stats.matches)
+        ) + '\n'
+        for offset, number in sorted(stats.offsets.items(), key=lambda x: -x[1])[:5]:
+            response += self.strings.STATS_OFFSET.format(offset=offset, number=number) + '\n'
+        (user_id, streak) = stats.best_streak
+        user_info: VigilChatMember = await self.get_member_name(user_id, group.id)
+        response += self.strings.STATS_STREAK.format(name=user_info.name, streak=streak) + '\n'
+        record: list or None = stats.users.get(message.from_user.id, None)
+        if record:
+            response += self.strings.STATS_USER.format(
+                wins=record[0],
+                streak=stats.current_streak(message.from_user.id, VigilClock.utcnow().strftime('%Y/%m/%d')),
+                best_streak=record[4],
+                time=stats.average_time(record[1], record[0])
+            ) + '\n'
+        return await self.answer(message, response)
+
+    async def handler_debug(self, message: types.Message):
+        if message.from_user.id not in self.data['admins']:
+            return
+        uptime: timedelta = timedelta(seconds=int(time.time() - self.metrics.started))
+        lines: list = [self.strings.DEBUG_UPTIME.format(uptime=uptime)]
+        for (section, name) in (('handlers', 'handler'), ('jobs', 'job'), ('api', 'api')):
+            lines.append(self.strings.DEBUG_SECTION.format(section=section))
+            for (value, count, average, p95, errors) in self.metrics.get_histograms(name):
+                lines.append(self.strings.DEBUG_LATENCY.format(
+                    name=value, count=count, average=average * 1000,
+                    p95=('%g' % (p95 * 1000)) if p95 is not None else '∞', errors=errors
+                ))
+        lines.append(self.strings.DEBUG_SECTION.format(section='counters'))
+        for (name, label, value), count in sorted(self.metrics.counters.items()):
+            if not name.endswith('_errors'):
+                lines.append(self.strings.DEBUG_VALUE.format(name='%s %s' % (name, value), value=count))
+        lines.append(self.strings.DEBUG_SECTION.format(section='gauges'))
+        for (name, label, value, number) in self.metrics.collect_gauges():
+            lines.append(self.strings.DEBUG_VALUE.format(name='%s %s' % (name, value), value=number))
+        return await self.answer(message, '\n'.join(lines))
 
     async def handler_my_status(self, message: types.Message):
         if message.chat.id != message.from_user.id:
             return
+        response: str = await self.my_status(message.from_user.id)
+        if self.shard:  # Every worker lists the groups it owns, the front sends them as one reply
+            self.shard.notify('my_status', message.chat.id, message.message_id, response)
+            return
+        if response:
+            await message.reply(response)
+
+    async def my_status(self, user_id: int) -> str:
         response: str = ''
         for group in self.data['groups'].values():
-            if message.from_user.id not in group.hall.keys():
+            if user_id not in group.hall.keys():
                 continue
             group_info: types.Chat = await self.bot.get_chat(group.id)
             if group_info.username:
@@ -1007,41 +3006,154 @@ class VigilBot(object):
                 group_name: str = '“%s”' % group_info.title
             response += self.strings.MY_STATUS_MEMBER.format(
                 group_name=group_name,
-                timezone=group.hall[message.from_user.id].timezone
+                timezone=group.hall[user_id].timezone
             )
-        if response:
-            await message.reply(response)
+        return response
 
     async def handler_update_user(self, message: types.Message):
+        if not self.is_participant(message.chat.id, message.from_user.id):  # Most messages end here
+            return
         group: VigilGroup or None = self.get_group(message.chat.id, follow_redir=True)
         if (not group) or (not group.enabled):
             return
         user: VigilUser or None = group.get_user(message.from_user.id)
         if not user:
             return
-        self.chat_members[user.id]: VigilChatMember = VigilChatMember(message.from_user)
-        tz: pytz.timezone = pytz.timezone(user.timezone)
-        localized_time: datetime = pytz.utc.localize(datetime.utcnow(), is_dst=None).astimezone(tz)
+        self.chat_members.put(group.id, user.id, VigilChatMember(message.from_user))
+        localized_time: datetime = VigilTime.get_local_time(user.timezone)
         start_time: int = (24 + group.start_time - group.deadline) % 24
         if (localized_time.hour < group.stop_time) or (localized_time.hour >= start_time):
-            user.active_time.append(datetime.utcnow())
-            group.update_hall(user)
-            self.update_group(group)
+            group.update_activity(user, VigilClock.utcnow())
             logger.info('Status of user "%s" in group "%s" updated' % (user.id, group.id))
 
+    async def handler_chat_member(self, update: types.ChatMemberUpdated):
+        self.permissions.update(update.chat.id, update.new_chat_member)
+
     async def handler_imawake(self, message: types.Message):
         await self.handler_update_user(message)
-        await message.reply(self.strings.I_AM_AWAKE_RESPONSE)
+        return await self.answer(message, self.strings.I_AM_AWAKE_RESPONSE)
 
     async def handler_stop(self, message: types.Message):
         group: VigilGroup or None = self.get_group(message.chat.id)
         if not group:
             return
         if await self.is_valid(group, message):
-            del self.data['groups'][group.id]
+            self.remove_group(group)
             logger.info('Information deleted for group with ID "%s"' % group.id)
 
-    def start(self):
+    def is_behind(self) -> bool:  # Overdue decisions are planned or being run
+        return bool(self.running_matches) or any(
+            job.id.startswith('match:') and (job.args[1] <= VigilClock.utcnow()) for job in self.scheduler.get_jobs()
+        )
+
+    async def catch_up(self):  # Updates are only handled once the overdue decisions have been replayed
+        started: float = time.perf_counter()
+        while True:
+            if not self.is_behind():
+                await asyncio.sleep(0)  # Jobs just taken by the scheduler only start running on the next iteration
+                if not self.is_behind():
+                    break
+            await asyncio.sleep(0.1)
+        if time.perf_counter() - started > 0.1:
+            logger.info('Missed decisions replayed in %.3f seconds' % (time.perf_counter() - started))
+
+    async def on_webhook_startup(self, dispatcher: Dispatcher):
+        await self.catch_up()
+        certificate = open(self.webhook['cert'], 'rb') if self.webhook.get('cert', None) else None
+        await self.bot.set_webhook(
+            self.webhook['url'], certificate=certificate, allowed_updates=self.allowed_updates
+        )
+        if certificate:
+            certificate.close()
+        logger.info('Webhook set to "%s"' % self.webhook['url'])
+        await self.start_metrics_server()
+
+    async def on_webhook_shutdown(self, dispatcher: Dispatcher):
+        await self.bot.delete_webhook()
+        logger.info('Webhook deleted')
+        await self.on_shutdown(dispatcher)
+
+    async def on_polling_startup(self, dispatcher: Dispatcher):
+        loop: asyncio.AbstractEventLoop = asyncio.get_event_loop()
+        loop.add_signal_handler(signal.SIGTERM, loop.stop)  # The executor shuts down cleanly once the loop stops
+        await self.catch_up()
+        await self.start_metrics_server()
+
+    async def start_metrics_server(self):
+        if not self.metrics_address:
+            return
+        app: web.Application = web.Application()
+        app.router.add_get('/metrics', self.handle_metrics_request)
+        runner: web.AppRunner = web.AppRunner(app)
+        await runner.setup()
+        await web.TCPSite(runner, *self.metrics_address).start()
+        logger.info('Metrics served on "http://%s:%s/metrics"' % self.metrics_address)
+
+    async def handle_metrics_request(self, request: web.Request) -> web.Response:
+        return web.Response(text=self.metrics.render(), content_type='text/plain')
+
+    def handle_job_overrun(self, event):
+        job: str = event.job_id.split(':', maxsplit=1)[0]
+        self.metrics.inc('job_overruns', 'job', job)
+        logger.warning('Job "%s" did not run on time' % event.job_id)
+
+    def schedule(self, function, trigger: str, **kwargs):  # Timed, and identified by the name of the function
+        self.scheduler.add_job(
+            self.metrics.timed('job', 'job', function.__name__, function), trigger, id=function.__name__, **kwargs
+        )
+
+    def start_worker(self):  # Updates come from the front process instead of Telegram
+        self.register_handlers()
+        asyncio.run(self.serve_shard())
+
+    async def serve_shard(self):
+        loop: asyncio.AbstractEventLoop = asyncio.get_event_loop()
+        Bot.set_current(self.bot)
+        Dispatcher.set_current(self.dispatcher)
+        self.schedule_jobs()
+        self.scheduler.start()
+        await self.catch_up()
+        await self.start_metrics_server()
+        self.shard.notify('ready', dict(self.redirects))
+        logger.info('Worker %s of %s serving %s groups' % (
+            self.shard.index, self.shard.count, len(self.data['groups'])
+        ))
+        while True:
+            instruction: tuple or None = await loop.run_in_executor(None, self.shard.receive)
+            if instruction is None:  # Sent by the front process when it stops
+                break
+            self.handle_instruction(*instruction)
+        if self.tasks:
+            await asyncio.wait(self.tasks)
+        await self.on_shutdown(self.dispatcher)
+        await (await self.bot.get_session()).close()
+
+    def handle_instruction(self, instruction: str, *args):
+        if instruction == 'update':
+            task: asyncio.Task = asyncio.get_event_loop().create_task(self.process_update(args[0]))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+        elif instruction == 'admin':
+            self.add_admin(args[0])
+        elif instruction == 'add_group':
+            self.add_group(*args)
+        else:
+            logger.warning('Unknown instruction "%s"' % instruction)
+
+    async def process_update(self, update: dict):
+        try:
+            await self.dispatcher.process_update(types.Update.to_object(update))
+        except Exception as e:
+            logger.warning('Failed to handle update "%s": %s' % (update.get('update_id', None), repr(e)))
+
+    async def on_shutdown(self, dispatcher: Dispatcher):
+        self.update_checkpoint(force=True)
+        if self.scheduler.running:
+            self.scheduler.shutdown(wait=False)
+        self.persistence.shutdown(wait=True)
+        self.dump_data()
+
+    def register_handlers(self):
         commands = [
             (['add_admin'], self.handler_add_admin),
             (['add_group'], self.handler_add_group),
@@ -1075,19 +3187,272 @@ class VigilBot(object):
             (['imawake'], self.handler_imawake),
             (['stop'], self.handler_stop),
             (['list'], self.handler_list),
-            (['my_status'], self.handler_my_status)
+            (['my_status'], self.handler_my_status),
+            (['leaderboard'], self.handler_leaderboard),
+            (['stats'], self.handler_stats),
+            (['debug'], self.handler_debug)
         ]
         for command in commands:
-            self.dispatcher.register_message_handler(command[1], commands=command[0])
+            self.dispatcher.register_message_handler(
+                self.metrics.timed('handler', 'handler', command[1].__name__, command[1]), commands=command[0]
+            )
             logger.info('Command "%s" registered' % command[0])
-        self.dispatcher.register_message_handler(self.handler_update_user, content_types=ContentType.ANY)
-        self.scheduler.add_job(self.maintain_user_list, 'cron', hour='*/1', next_run_time=datetime.now())
-        self.scheduler.add_job(self.update_title_all, 'cron', minute='*/30', next_run_time=datetime.now())
-        self.scheduler.add_job(self.broadcast_winner, 'cron', minute='*/1', next_run_time=datetime.now())
-        self.scheduler.add_job(self.broadcast_match_start, 'cron', minute='*/30')
-        self.scheduler.add_job(self.broadcast_hall_status, 'cron', hour='*/2')
+        self.dispatcher.register_message_handler(
+            self.metrics.timed('handler', 'handler', 'handler_update_user', self.handler_update_user),
+            content_types=ContentType.ANY
+        )
+        handler_chat_member = self.metrics.timed('handler', 'handler', 'handler_chat_member', self.handler_chat_member)
+        self.dispatcher.register_chat_member_handler(handler_chat_member)
+        self.dispatcher.register_my_chat_member_handler(handler_chat_member)
+
+    def schedule_jobs(self):
+        self.schedule(self.maintain_user_list, 'cron', hour='*/1', next_run_time=datetime.now())
+        self.schedule(self.update_title_all, 'cron', minute='*/30', next_run_time=datetime.now())
+        self.schedule(self.broadcast_winner, 'date')  # Leftovers from the last run
+        now: datetime = VigilClock.utcnow()
+        since: datetime = now
+        if self.data.get('checkpoint', None):  # Decision points missed since then are overdue and replayed first
+            since = min(max(self.data['checkpoint'], now - timedelta(days=self.winner_retention)), now)
+        for group_id in list(self.data['groups'].keys()):
+            self.plan_match(group_id, after=since)
+        self.schedule(self.broadcast_hall_status, 'cron', hour='*/2')
+        self.schedule(self.flush_data, 'interval', seconds=self.persist_interval)
+        self.schedule(self.compact_data, 'cron', minute='*/10')
+        self.schedule(self.archive_winners, 'cron', hour='0', minute='5', next_run_time=datetime.now())
+
+    def start(self, webhook: dict or None = None):
+        self.register_handlers()
+        self.schedule_jobs()
         self.scheduler.start()
-        executor.start_polling(self.dispatcher)
+        if not webhook:
+            executor.start_polling(
+                self.dispatcher,
+                on_startup=self.on_polling_startup,
+                on_shutdown=self.on_shutdown,
+                allowed_updates=self.allowed_updates
+            )
+            return
+        self.webhook = webhook
+        ssl_context: ssl.SSLContext or None = None
+        if webhook.get('cert', None) and webhook.get('key', None):  # Otherwise TLS is left to a reverse proxy
+            ssl_context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+            ssl_context.load_cert_chain(webhook['cert'], webhook['key'])
+        executor.start_webhook(
+            self.dispatcher, webhook['path'],
+            on_startup=self.on_webhook_startup,
+            on_shutdown=self.on_webhook_shutdown,
+            host=webhook['host'],
+            port=webhook['port'],
+            ssl_context=ssl_context
+        )
+
+
+class VigilFront(object):  # Receives every update and routes it to the worker process owning the (master) group
+    def __init__(
+            self, token: str,
+            admins: list,
+            workers: int,
+            storage: str = 'journal',
+            data_path: str or None = None,
+            **options
+    ):
+        self.token: str = token
+        self.admins: list = admins
+        self.workers: int = workers
+        self.storage: str = storage
+        self.data_path: str = data_path or VigilStorage.backend(storage).default_path
+        self.options: dict = options  # Passed on to the VigilBot of every worker
+        self.bot: Bot = Bot(token=token)
+        self.dispatcher: Dispatcher = Dispatcher(self.bot)
+        self.webhook: dict or None = None
+        self.context = multiprocessing.get_context('spawn')  # Nothing of the event loop leaks into the workers
+        self.events: multiprocessing.Queue = self.context.Queue()
+        self.inboxes: list = [self.context.Queue() for _ in range(workers)]
+        self.processes: list = list()
+        self.redirects: dict = dict()  # Slave group ID -> master group ID, as reported by the workers
+        self.ready: set = set()  # Workers done with loading their groups
+        self.statuses: dict = dict()  # (chat ID, message ID) of a /my_status -> {worker index: part of the reply}
+        self.receiver: asyncio.Task or None = None
+
+    def get_path(self, index: int) -> str:
+        return VigilShard.get_path(self.data_path, index, self.workers)
+
+    def prepare_shards(self):  # Blocking, moves the groups into the shards of the configured number of workers
+        layout_path: str = self.data_path + '.workers'
+        previous: int or None = None
+        if os.path.isfile(layout_path):
+            with open(layout_path) as f:
+                previous = int(f.read())
+        if previous == self.workers:
+            return
+        sources: list = [self.data_path] if previous is None else [
+            VigilShard.get_path(self.data_path, index, previous) for index in range(previous)
+        ]
+        targets: list = [VigilStorage.create(self.storage, self.get_path(index)) for index in range(self.workers)]
+        checkpoints: list = list()
+        for source_path in sources:
+            if not VigilStorage.backend(self.storage).exists(source_path):
+                continue
+            data: dict = VigilStorage.create(self.storage, source_path).load()
+            if data.get('checkpoint', None):
+                checkpoints.append(data['checkpoint'])
+            if isinstance(data['groups'], VigilGroupMap):
+                for group_id in list(data['groups'].unloaded):
+                    data['groups'].load(group_id)
+            shards: list = [{'admins': data['admins'], 'groups': dict()} for _ in range(self.workers)]
+            for group in data['groups'].values():
+                index: int = VigilShard.owner(group.id if group.master else group.slave_of, self.workers)
+                shards[index]['groups'][group.id] = group
+                archive_path: str = os.path.join(source_path + '.archive', str(group.id))
+                if os.path.isdir(archive_path):  # Copied, the source is left as it is
+                    shutil.copytree(
+                        archive_path, os.path.join(self.get_path(index) + '.archive', str(group.id)),
+                        dirs_exist_ok=True
+                    )
+            for (target, shard) in zip(targets, shards):
+                target.import_data(shard)
+            logger.info('%s groups of "%s" moved into %s shards' % (len(data['groups']), source_path, self.workers))
+        if checkpoints:  # The earliest one, nothing missed by any of the sources is skipped
+            for target in targets:
+                target.set_checkpoint(min(checkpoints))
+                target.flush()
+        with open(layout_path, 'w') as f:
+            f.write(str(self.workers))
+
+    @staticmethod
+    def run_worker(index: int, count: int, inbox: multiprocessing.Queue, events: multiprocessing.Queue,
+                   token: str, admins: list, options: dict):
+        signal.signal(signal.SIGINT, signal.SIG_IGN)  # Stopped by the front process, after the last routed update
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+        VigilBot(token, admins, shard=VigilShard(index, count, inbox, events), **options).start_worker()
+
+    def start_workers(self):
+        for index in range(self.workers):
+            options: dict = dict(self.options, storage=self.storage, data_path=self.get_path(index))
+            if options.get('metrics_address', None):  # One port per worker, counting up
+                options['metrics_address'] = (options['metrics_address'][0], options['metrics_address'][1] + index)
+            process: multiprocessing.Process = self.context.Process(
+                target=self.run_worker,
+                args=(index, self.workers, self.inboxes[index], self.events, self.token, self.admins, options),
+                name='vigil-worker-%s' % index
+            )
+            process.start()
+            self.processes.append(process)
+        logger.info('%s worker processes started' % self.workers)
+
+    async def receive_events(self):
+        loop: asyncio.AbstractEventLoop = asyncio.get_event_loop()
+        while True:
+            event: tuple or None = await loop.run_in_executor(None, self.events.get)
+            if event is None:
+                return
+            self.handle_event(*event)
+
+    def handle_event(self, event: str, index: int, *args):
+        if event == 'ready':
+            self.redirects.update(args[0])
+            self.ready.add(index)
+        elif event == 'redirect':
+            (group_id, master) = args
+            if master is None:
+                self.redirects.pop(group_id, None)
+            else:
+                self.redirects[group_id] = master
+        elif event == 'admin':
+            for (other, inbox) in enumerate(self.inboxes):
+                if other != index:
+                    inbox.put(('admin', args[0]))
+        elif event == 'forward':  # Meant for the worker owning another group
+            (group_id, instruction, arguments) = args
+            self.inboxes[VigilShard.owner(group_id, self.workers)].put((instruction,) + tuple(arguments))
+        elif event == 'my_status':
+            (chat_id, message_id, response) = args
+            parts: dict = self.statuses.setdefault((chat_id, message_id), dict())
+            parts[index] = response
+            if len(parts) == self.workers:  # Answered by every worker
+                del self.statuses[(chat_id, message_id)]
+                response = ''.join(parts[other] for other in range(self.workers))
+                if response:
+                    asyncio.get_event_loop().create_task(
+                        self.bot.send_message(chat_id, response, reply_to_message_id=message_id)
+                    )
+        else:
+            logger.warning('Unknown event "%s" from worker %s' % (event, index))
+
+    async def route_update(self, *args):
+        update: types.Update = types.Update.get_current()
+        chat: types.Chat = (update.message or update.chat_member or update.my_chat_member).chat
+        if (chat.type == types.ChatType.PRIVATE) and update.message and update.message.is_command() and \
+                (update.message.get_command(pure=True) == 'my_status'):
+            targets: range or list = range(self.workers)  # Every worker lists the groups it owns
+        else:
+            targets: range or list = [VigilShard.owner(self.redirects.get(chat.id, chat.id), self.workers)]
+        for index in targets:
+            self.inboxes[index].put(('update', update.to_python()))
+
+    async def wait_for_workers(self):  # Redirects of every worker are known before the first update is routed
+        self.receiver = asyncio.get_event_loop().create_task(self.receive_events())
+        while len(self.ready) < self.workers:
+            if not all(process.is_alive() for process in self.processes):
+                raise RuntimeError('Worker process exited during startup')
+            await asyncio.sleep(0.1)
+        logger.info('All %s workers are ready' % self.workers)
+
+    async def on_polling_startup(self, dispatcher: Dispatcher):
+        loop: asyncio.AbstractEventLoop = asyncio.get_event_loop()
+        loop.add_signal_handler(signal.SIGTERM, loop.stop)
+        await self.wait_for_workers()
+
+    async def on_webhook_startup(self, dispatcher: Dispatcher):
+        await self.wait_for_workers()
+        certificate = open(self.webhook['cert'], 'rb') if self.webhook.get('cert', None) else None
+        await self.bot.set_webhook(
+            self.webhook['url'], certificate=certificate, allowed_updates=VigilBot.ALLOWED_UPDATES
+        )
+        if certificate:
+            certificate.close()
+        logger.info('Webhook set to "%s"' % self.webhook['url'])
+
+    async def on_webhook_shutdown(self, dispatcher: Dispatcher):
+        await self.bot.delete_webhook()
+        logger.info('Webhook deleted')
+        await self.on_shutdown(dispatcher)
+
+    async def on_shutdown(self, dispatcher: Dispatcher):
+        for inbox in self.inboxes:
+            inbox.put(None)
+        for process in self.processes:
+            await asyncio.get_event_loop().run_in_executor(None, process.join)
+        self.events.put(None)
+        logger.info('Worker processes stopped')
+
+    def start(self, webhook: dict or None = None):
+        self.prepare_shards()
+        self.start_workers()
+        self.dispatcher.register_message_handler(self.route_update, content_types=ContentType.ANY)
+        self.dispatcher.register_chat_member_handler(self.route_update)
+        self.dispatcher.register_my_chat_member_handler(self.route_update)
+        if not webhook:
+            executor.start_polling(
+                self.dispatcher,
+                on_startup=self.on_polling_startup,
+                on_shutdown=self.on_shutdown,
+                allowed_updates=VigilBot.ALLOWED_UPDATES
+            )
+            return
+        self.webhook = webhook
+        ssl_context: ssl.SSLContext or None = None
+        if webhook.get('cert', None) and webhook.get('key', None):
+            ssl_context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+            ssl_context.load_cert_chain(webhook['cert'], webhook['key'])
+        executor.start_webhook(
+            self.dispatcher, webhook['path'],
+            on_startup=self.on_webhook_startup,
+            on_shutdown=self.on_webhook_shutdown,
+            host=webhook['host'],
+            port=webhook['port'],
+            ssl_context=ssl_context
+        )
 
 
 if __name__ == '__main__':
@@ -1099,7 +3464,27 @@ if __name__ == '__main__':
     validator: t.Dict = t.Dict({
         t.Key('token'): t.String,
         t.Key('admins'):
-            t.List(t.Int())
+            t.List(t.Int()),
+        t.Key('storage', optional=True, default='journal'): t.Enum('journal', 'sqlite', 'sharded'),
+        t.Key('data_path', optional=True): t.String,
+        t.Key('member_cache_size', optional=True, default=10000): t.Int(gt=0),
+        t.Key('member_cache_ttl', optional=True, default=43200): t.Int(gt=0),
+        t.Key('persist_interval', optional=True, default=5): t.Int(gt=0),
+        t.Key('winner_retention', optional=True, default=7): t.Int(gte=2),
+        t.Key('workers', optional=True, default=0): t.Int(gte=0),
+        t.Key('vectorized_resolver', optional=True, default=False): t.Bool,
+        t.Key('metrics', optional=True): t.Dict({
+            t.Key('host', optional=True, default='127.0.0.1'): t.String,
+            t.Key('port', optional=True, default=9090): t.Int(gte=1, lte=65535)
+        }),
+        t.Key('webhook', optional=True): t.Dict({
+            t.Key('url'): t.URL,
+            t.Key('host', optional=True, default='127.0.0.1'): t.String,
+            t.Key('port', optional=True, default=8443): t.Int(gte=1, lte=65535),
+            t.Key('path', optional=True, default='/vigil'): t.String,
+            t.Key('cert', optional=True): t.String,
+            t.Key('key', optional=True): t.String
+        })
     })
 
     parser: argparse.ArgumentParser = argparse.ArgumentParser()
@@ -1107,9 +3492,49 @@ if __name__ == '__main__':
         parser,
         default_config=CONFIG_PATH
     )
+    parser.add_argument('--webhook', action='store_true', help='receive updates with a webhook instead of polling')
+    parser.add_argument('--rebuild-stats', action='store_true', help='rebuild statistics from all winners and exit')
 
     options, unknown = parser.parse_known_args(argv)
     config: dict = commandline.config_from_options(options, validator)
-
-    vigil: VigilBot = VigilBot(config['token'], config['admins'])
-    vigil.start()
+    if options.webhook and ('webhook' not in config.keys()):
+        parser.error('--webhook requires a "webhook" section in the config file')
+
+    bot_options: dict = {
+        'member_cache_size': config['member_cache_size'],
+        'member_cache_ttl': config['member_cache_ttl'],
+        'persist_interval': config['persist_interval'],
+        'winner_retention': config['winner_retention'],
+        'vectorized_resolver': config['vectorized_resolver'],
+        'metrics_address': (config['metrics']['host'], config['metrics']['port']) if 'metrics' in config.keys() else None
+    }
+    if config['workers']:
+        front: VigilFront = VigilFront(
+            config['token'], config['admins'], config['workers'],
+            storage=config['storage'],
+            data_path=config.get('data_path', None),
+            **bot_options
+        )
+        if options.rebuild_stats:
+            front.prepare_shards()
+            for index in range(front.workers):
+                vigil: VigilBot = VigilBot(
+                    config['token'], config['admins'], data_path=front.get_path(index), storage=config['storage'],
+                    **bot_options
+                )
+                asyncio.run(vigil.rebuild_stats())
+                vigil.dump_data()
+        else:
+            front.start(webhook=config['webhook'] if options.webhook else None)
+    else:
+        vigil: VigilBot = VigilBot(
+            config['token'], config['admins'],
+            data_path=config.get('data_path', None),
+            storage=config['storage'],
+            **bot_options
+        )
+        if options.rebuild_stats:
+            asyncio.run(vigil.rebuild_stats())
+            vigil.dump_data()
+        else:
+            vigil.start(webhook=config['webhook'] if options.webhook else None)